@@ -1,6 +1,10 @@
 import pygame
 import button
-import csv
+import parallax
+import levels
+import tilemap
+import level_grid
+import autosave
 
 pygame.init()
 
@@ -20,6 +24,8 @@ pygame.display.set_caption("Level Editor")
 # define game variables
 rows = 16
 max_cols = 150
+# columns added or removed at a time when changing the level length
+length_step = 16
 tile_size = screen_height // rows
 tile_types = 27
 level = 0
@@ -28,6 +34,15 @@ scroll_left = False
 scroll_right = False
 scroll = 0
 scroll_speed = 1
+# baked chunks kept on each side of the screen
+KEEP_CHUNKS = 2
+# seconds without edits before the level is autosaved, and the longest an edit waits while editing goes on
+AUTOSAVE_DELAY = 1
+AUTOSAVE_MAX_DELAY = 10
+# corners of the selected rectangle in cells, and the last copied tiles
+selection = None
+selecting = False
+clipboard = None
 
 # load images
 sky_image = pygame.image.load("Images/Background/sky_cloud1.png").convert_alpha()
@@ -36,7 +51,7 @@ forest_image = pygame.image.load("Images/Background/forest.png").convert_alpha()
 # store tiles in list
 img_list = []
 for x in range(tile_types):
-    img = pygame.image.load(f"Images/Tiles/{x}.png")
+    img = pygame.image.load(f"Images/Tiles/{x}.png").convert_alpha()
     img = pygame.transform.scale(img, (tile_size, tile_size))
     img_list.append(img)
 
@@ -47,15 +62,15 @@ red = (200, 25, 25)
 
 # define font
 font = pygame.font.SysFont("Comic Sans MS", 30)
-# create empty list
-world_data = []
-for row in range(rows):
-    r = [-1] * max_cols
-    world_data.append(r)
+# create empty level
+world_data = level_grid.LevelGrid(rows, max_cols)
 
 # create ground
-for tile in range(0, max_cols):
-    world_data[rows - 1][tile] = 0
+world_data.fill_rect(0, rows - 1, max_cols - 1, rows - 1, 0)
+world_data.clear_history()
+# the empty level is not an edit, it is not autosaved
+world_data.take_dirty()
+autosaver = autosave.Autosave(".", AUTOSAVE_DELAY, AUTOSAVE_MAX_DELAY)
 
 
 def draw_text(text, font, text_col, x, y):
@@ -63,36 +78,88 @@ def draw_text(text, font, text_col, x, y):
     screen.blit(img, (x, y))
 
 
+# create background layers
+background = parallax.ParallaxBackground(screen.get_size(), green)
+background.add_layer(sky_image, 0.3, 0)
+background.add_layer(mountains_image, 0.65, screen_height - mountains_image.get_height() - 50)
+background.add_layer(forest_image, 0.8, screen_height - forest_image.get_height())
+
+
 # function for drawing bg
 def draw_bg():
-    screen.fill(green)
-    width = sky_image.get_width()
-    for x in range(5):
-        screen.blit(sky_image, ((x * width) - scroll * 0.3, 0))
-        screen.blit(mountains_image, ((x * width) - scroll * 0.65, screen_height - mountains_image.get_height() - 50))
-        screen.blit(forest_image, ((x * width) - scroll * 0.8, screen_height - forest_image.get_height()))
+    background.draw(screen, scroll)
 
 
 save_img = pygame.image.load("Images/Buttons/save.png").convert_alpha()
 load_img = pygame.image.load("Images/Buttons/load.png").convert_alpha()
 
 
+# the grid is drawn once, one tile wider than the screen, and shifted by the scroll within a tile
+grid_overlay = pygame.Surface((screen_width + tile_size + 1, screen_height + 1), pygame.SRCALPHA)
+# vertical lines
+for c in range(screen_width // tile_size + 2):
+    pygame.draw.line(grid_overlay, white, (c * tile_size, 0), (c * tile_size, screen_height))
+# horizontal lines
+for c in range(rows + 1):
+    pygame.draw.line(grid_overlay, white, (0, c * tile_size), (screen_width + tile_size, c * tile_size))
+
+
 # draw grid
 def draw_grid():
-    # vertical lines
-    for c in range(max_cols + 1):
-        pygame.draw.line(screen, white, (c * tile_size - scroll, 0), (c * tile_size - scroll, screen_height))
-    # horizontal lines
-    for c in range(rows + 1):
-        pygame.draw.line(screen, white, (0, c * tile_size), (screen_width, c * tile_size))
+    screen.blit(grid_overlay, (0, 0), (scroll % tile_size, 0, screen_width + 1, screen_height + 1))
+
+
+# baked surfaces of the chunks near the screen, by chunk index
+tile_chunks = {}
+
+
+def drop_chunks(first_col=0, last_col=None):
+    # forget the baked chunks over these columns, they are baked again when next drawn
+    for i in list(tile_chunks):
+        if (i + 1) * tilemap.CHUNK_COLS > first_col and (last_col is None or i * tilemap.CHUNK_COLS <= last_col):
+            del tile_chunks[i]
+
+
+def set_tile(x, y, tile):
+    # change one cell and redraw only that cell of its chunk
+    if world_data.get(x, y) == tile:
+        return
+    world_data.set(x, y, tile)
+    autosaver.changed(x, x)
+    chunk = tile_chunks.get(x // tilemap.CHUNK_COLS)
+    if chunk is not None:
+        cell = ((x % tilemap.CHUNK_COLS) * tile_size, y * tile_size, tile_size, tile_size)
+        chunk.fill((0, 0, 0, 0), cell)
+        if tile >= 0:
+            chunk.blit(img_list[tile], cell)
 
 
 # func for drawing world tiles
 def draw_world():
-    for y, row in enumerate(world_data):
-        for x, tile in enumerate(row):
-            if tile >= 0:
-                screen.blit(img_list[tile], (x * tile_size - scroll, y * tile_size))
+    # chunks changed by fills, pastes, column changes and undo are baked again
+    dirty = world_data.take_dirty()
+    if dirty is not None:
+        drop_chunks(*dirty)
+        autosaver.changed(*dirty)
+    chunk_count = (world_data.cols + tilemap.CHUNK_COLS - 1) // tilemap.CHUNK_COLS
+    visible = tilemap.visible_chunks(scroll, screen_width, chunk_count, tile_size)
+    # bake the chunks coming into view and drop the ones far from it
+    for i in list(tile_chunks):
+        if i < visible.start - KEEP_CHUNKS or i >= visible.stop + KEEP_CHUNKS:
+            del tile_chunks[i]
+    for i in visible:
+        if i not in tile_chunks:
+            tile_chunks[i] = tilemap.bake_chunk(world_data.columns(i * tilemap.CHUNK_COLS, tilemap.CHUNK_COLS), 0,
+                                                img_list, tile_size)
+        screen.blit(tile_chunks[i], (i * tilemap.CHUNK_COLS * tile_size - scroll, 0))
+
+
+def draw_selection():
+    if selection is not None:
+        (x0, y0), (x1, y1) = selection
+        rect = (min(x0, x1) * tile_size - scroll, min(y0, y1) * tile_size,
+                (abs(x1 - x0) + 1) * tile_size, (abs(y1 - y0) + 1) * tile_size)
+        pygame.draw.rect(screen, red, rect, 3)
 
 
 # create buttons
@@ -119,25 +186,24 @@ while run:
     draw_bg()
     draw_grid()
     draw_world()
+    draw_selection()
 
-    draw_text(f"Level: {level}", font, white, 10, screen_height + lower_margin - 90)
+    draw_text(f"Level: {level}   Length: {world_data.cols} (PG UP/DN)", font, white, 10, screen_height + lower_margin - 90)
     draw_text(f"Press UP or DOWN to change level", font, white, 10, screen_height + lower_margin - 60)
+    draw_text(f"LSHIFT select F fill B bucket", font, white, 10, screen_height + lower_margin - 30)
     # save and load data
     if save_button.draw(screen):
-        # save level data
-        with open(f"level{level}_data.csv", "w", newline="") as csvfile:
-            writer = csv.writer(csvfile, delimiter=",")
-            for row in world_data:
-                writer.writerow(row)
+        # save level data as csv and as the binary file the game loads, on the autosave thread
+        autosaver.save_level(world_data, level)
     if load_button.draw(screen):
         # load in level data
         # reset scroll to the start
         scroll = 0
-        with open(f"level{level}_data.csv", newline="") as csvfile:
-            reader = csv.reader(csvfile, delimiter=",")
-            for x, row in enumerate(reader):
-                for y, tile in enumerate(row):
-                    world_data[x][y] = int(tile)
+        autosaver.wait()
+        world_data = level_grid.from_view(levels.load_level(".", level))
+        selection = None
+        drop_chunks()
+        autosaver.forget()
 
     # draw tile panel and tiles
     pygame.draw.rect(screen, green, (screen_width, 0, side_margin, screen_height))
@@ -154,7 +220,7 @@ while run:
     # scroll the map
     if scroll_left and scroll > 0:
         scroll -= 5 * scroll_speed
-    if scroll_right and scroll < (max_cols * tile_size) - screen_width:
+    if scroll_right and scroll < (world_data.cols * tile_size) - screen_width:
         scroll += 5 * scroll_speed
 
     # add new tiles to the screen
@@ -164,19 +230,34 @@ while run:
     y = pos[1] // tile_size
 
     # check that coordinates are within the tile area
-    if pos[0] < screen_width and pos[1] < screen_height:
-        # update tile value
-        if pygame.mouse.get_pressed()[0] == 1:
-            if world_data[y][x] != current_tile:
-                world_data[y][x] = current_tile
-        if pygame.mouse.get_pressed()[2] == 1:
-            world_data[y][x] = -1
+    in_map = pos[0] < screen_width and pos[1] < screen_height
+    pressed = pygame.mouse.get_pressed()
+    if in_map:
+        # drag with left shift held to select a rectangle
+        if pygame.key.get_mods() & pygame.KMOD_LSHIFT:
+            if pressed[0] == 1:
+                if not selecting:
+                    selection = ((x, y), (x, y))
+                    selecting = True
+                selection = (selection[0], (x, y))
+        else:
+            # update tile value
+            if pressed[0] == 1:
+                set_tile(x, y, current_tile)
+            if pressed[2] == 1:
+                set_tile(x, y, -1)
+    # everything painted until the mouse is let go is undone in one step
+    if not any(pressed):
+        selecting = False
+        world_data.commit()
 
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             run = False
         # keyboard presses
         if event.type == pygame.KEYDOWN:
+            # keep what was painted so far apart from what the key does in the undo history
+            world_data.commit()
             if event.key == pygame.K_UP:
                 level += 1
             if event.key == pygame.K_DOWN and level > 0:
@@ -187,6 +268,59 @@ while run:
                 scroll_right = True
             if event.key == pygame.K_RSHIFT:
                 scroll_speed = 5
+            # make the level longer or shorter, new columns get ground
+            if event.key == pygame.K_PAGEUP:
+                world_data.insert_columns(world_data.cols, length_step)
+                world_data.fill_rect(world_data.cols - length_step, rows - 1, world_data.cols - 1, rows - 1, 0)
+                world_data.commit()
+            if event.key == pygame.K_PAGEDOWN and world_data.cols - length_step >= screen_width // tile_size:
+                world_data.delete_columns(world_data.cols - length_step, length_step)
+                world_data.commit()
+            # insert or delete a column at the mouse
+            if event.key == pygame.K_INSERT and in_map:
+                world_data.insert_columns(x, 1)
+                world_data.fill_rect(x, rows - 1, x, rows - 1, 0)
+                world_data.commit()
+            if event.key == pygame.K_DELETE and in_map and world_data.cols > screen_width // tile_size:
+                world_data.delete_columns(x, 1)
+                world_data.commit()
+            # fill the selection or the area under the mouse with the current tile
+            if event.key == pygame.K_f and selection is not None:
+                (x0, y0), (x1, y1) = selection
+                world_data.fill_rect(x0, y0, x1, y1, current_tile)
+                world_data.commit()
+            if event.key == pygame.K_b and in_map:
+                world_data.flood_fill(x, y, current_tile)
+                world_data.commit()
+            # copy the selection and paste it with its top left corner at the mouse
+            if event.key == pygame.K_c and event.mod & pygame.KMOD_CTRL and selection is not None:
+                (x0, y0), (x1, y1) = selection
+                clipboard = world_data.copy(x0, y0, x1, y1)
+            if event.key == pygame.K_v and event.mod & pygame.KMOD_CTRL and clipboard is not None and in_map:
+                world_data.paste(clipboard, x, y)
+                world_data.commit()
+            if event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
+                world_data.undo()
+            if event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
+                world_data.redo()
+            if event.key == pygame.K_ESCAPE:
+                selection = None
+            # bring back the autosave of this level, after a crash or to drop the changes since
+            if event.key == pygame.K_r and event.mod & pygame.KMOD_CTRL:
+                save_dir = levels.autosave_path(".", level)
+                autosaver.wait()
+                if levels.autosave_time(save_dir) is not None:
+                    try:
+                        restored = level_grid.from_view(levels.read_autosave(save_dir))
+                    except (OSError, ValueError):
+                        # an autosave from an older editor or a damaged one is left alone
+                        restored = None
+                    if restored is not None:
+                        scroll = 0
+                        world_data = restored
+                        selection = None
+                        drop_chunks()
+                        autosaver.forget()
 
         if event.type == pygame.KEYUP:
             if event.key == pygame.K_LEFT:
@@ -196,6 +330,13 @@ while run:
             if event.key == pygame.K_RSHIFT:
                 scroll_speed = 1
 
+    # the level may have become shorter
+    scroll = max(min(scroll, world_data.cols * tile_size - screen_width), 0)
+
+    autosaver.update(world_data, level)
+
     pygame.display.update()
 
+# save the last edits before closing
+autosaver.flush(world_data, level)
 pygame.quit()
@@ -0,0 +1,130 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import pygame
+
+# bundle files hold a header, a json index and then the raw rgba pixels of every image, already scaled
+BUNDLE_MAGIC = b"PIMG"
+BUNDLE_VERSION = 1
+HEADER = struct.Struct("<4sHI")  # magic, version, index length
+
+
+class AssetBundle():
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        # the bundle file mapped into memory, the pixels of an image are only read when it is first asked for
+        self.data = None
+        self.data_start = 0
+        self.images = {}
+        # the bundle images made so far, the file is let go once all of them are
+        self.unpacked = set()
+        # modification times of the source images, every file is only looked at once
+        self.mtimes = {}
+        # the level preloader thread loads animations too
+        self.lock = threading.Lock()
+        self.open_bundle()
+
+    def open_bundle(self):
+        # a damaged bundle is left alone and the images are loaded from their files
+        if not os.path.exists(self.path):
+            return
+        data = None
+        try:
+            with open(self.path, "rb") as bundle_file:
+                data = mmap.mmap(bundle_file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, index_length = HEADER.unpack_from(data)
+            if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+                data.close()
+                return
+            index = json.loads(data[HEADER.size:HEADER.size + index_length])
+            if not isinstance(index, dict):
+                raise ValueError("the index is not a table of images")
+        except (OSError, ValueError, struct.error) as error:
+            print(f"{self.path} could not be read, the images are loaded from their files: {error}")
+            if data is not None:
+                data.close()
+            return
+        self.index = index
+        self.data = data
+        self.data_start = HEADER.size + index_length
+
+    def image(self, path, size=None, scale=None):
+        # the image at path scaled to size or by scale, converted for fast blitting
+        if size is not None:
+            key = f"{path}@{size[0]}x{size[1]}"
+        elif scale is not None:
+            key = f"{path}@x{scale}"
+        else:
+            key = path
+        with self.lock:
+            if key not in self.images:
+                self.images[key] = self.load(key, path, size, scale)
+            return self.images[key]
+
+    def load(self, key, path, size, scale):
+        entry = self.index.get(key)
+        if entry is not None and self.data is not None:
+            # images changed since the bundle was built are loaded from their file,
+            # the bundle still has the ones whose file is gone
+            mtime = self.mtime(path)
+            img = self.unpack(entry) if mtime is None or entry.get("mtime") == mtime else None
+            self.unpacked.add(key)
+            if len(self.unpacked) == len(self.index):
+                self.data.close()
+                self.data = None
+            if img is not None:
+                return img
+        img = pygame.image.load(path).convert_alpha()
+        if scale is not None:
+            size = (int(img.get_width() * scale), int(img.get_height() * scale))
+        if size is not None:
+            img = pygame.transform.scale(img, size)
+        return img
+
+    def unpack(self, entry):
+        # the image of an index entry, or None when the entry does not fit the bundle
+        try:
+            start = self.data_start + entry["offset"]
+            pixels = self.data[start:start + entry["length"]]
+            return pygame.image.frombuffer(pixels, entry["size"], "RGBA").convert_alpha()
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def mtime(self, path):
+        # None for a file that is not there
+        if path not in self.mtimes:
+            self.mtimes[path] = os.path.getmtime(path) if os.path.exists(path) else None
+        return self.mtimes[path]
+
+    def save(self):
+        # write every image asked for so far, to a temporary file first so a failed build leaves the old one
+        index = {}
+        pixel_data = []
+        offset = 0
+        with self.lock:
+            for key, img in self.images.items():
+                pixels = pygame.image.tobytes(img, "RGBA")
+                index[key] = {"size": img.get_size(), "offset": offset, "length": len(pixels),
+                              "mtime": self.mtime(key.split("@")[0])}
+                pixel_data.append(pixels)
+                offset += len(pixels)
+        index_data = json.dumps(index).encode()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as bundle_file:
+            bundle_file.write(HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(index_data)))
+            bundle_file.write(index_data)
+            for pixels in pixel_data:
+                bundle_file.write(pixels)
+        # the old bundle is let go first, a mapped file cannot be replaced everywhere
+        with self.lock:
+            if self.data is not None:
+                self.data.close()
+                self.data = None
+            os.replace(temp_path, self.path)
+            # images not asked for yet are read from the new bundle
+            self.index = {}
+            self.unpacked = set()
+            self.open_bundle()
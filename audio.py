@@ -0,0 +1,49 @@
+from pygame import mixer
+
+
+# plays sound effects on reserved mixer channels, each sound has its own group of channels
+# so a burst of one sound cannot take the voices of the others
+class SoundManager():
+    def __init__(self, get_view, cull_distance):
+        # get_view returns the camera view, sounds further than cull_distance from it are not played
+        self.get_view = get_view
+        self.cull_distance = cull_distance
+        self.sounds = {}
+        self.reserved = 0
+        self.play_count = 0
+
+    def add(self, name, path, volume, voices):
+        # voices is how many copies of the sound can play at once
+        sound = mixer.Sound(path)
+        sound.set_volume(volume)
+        first = self.reserved
+        self.reserved += voices
+        if mixer.get_num_channels() < self.reserved + 4:
+            mixer.set_num_channels(self.reserved + 4)
+        # reserved channels are never picked by Sound.play
+        mixer.set_reserved(self.reserved)
+        # each voice is [channel, priority, play order]
+        self.sounds[name] = (sound, [[mixer.Channel(i), 0, 0] for i in range(first, self.reserved)])
+
+    def play(self, name, x=None, priority=0):
+        # x is the position of the sound in the world, sounds without one are always played
+        if x is not None:
+            view = self.get_view()
+            if x < view.left - self.cull_distance or x > view.right + self.cull_distance:
+                return False
+        sound, voices = self.sounds[name]
+        free = None
+        for voice in voices:
+            if not voice[0].get_busy():
+                free = voice
+                break
+        if free is None:
+            # all voices are busy, take the one with the lowest priority, the oldest of those first
+            free = min(voices, key=lambda voice: (voice[1], voice[2]))
+            if free[1] > priority:
+                return False
+        self.play_count += 1
+        free[0].play(sound)
+        free[1] = priority
+        free[2] = self.play_count
+        return True
@@ -0,0 +1,110 @@
+import threading
+import time
+import levels
+
+
+# saves the editor's level in the background, a chunk of columns is only written again when it changed
+class Autosave():
+    def __init__(self, level_dir, delay, max_delay):
+        # a save starts once there have been no edits for delay seconds,
+        # or max_delay seconds after the first unsaved edit while editing goes on
+        self.level_dir = level_dir
+        self.delay = delay
+        self.max_delay = max_delay
+        self.dirty = set()
+        # every chunk from this one on changed, after columns were inserted or deleted
+        self.dirty_from = None
+        self.first_change = None
+        self.last_change = None
+        # the autosave the files on disk belong to, everything is written when it is another one
+        self.saved_dir = None
+        # set by the worker when a save could not be written, the main thread then saves everything again
+        self.failed = False
+        self.thread = None
+
+    def changed(self, first_col, last_col=None):
+        # last_col None is up to the end of the level
+        first = first_col // levels.AUTOSAVE_CHUNK_COLS
+        if last_col is None:
+            self.dirty_from = first if self.dirty_from is None else min(self.dirty_from, first)
+        else:
+            self.dirty.update(range(first, last_col // levels.AUTOSAVE_CHUNK_COLS + 1))
+        self.last_change = time.monotonic()
+        if self.first_change is None:
+            self.first_change = self.last_change
+
+    def forget(self):
+        # the level was loaded, the next edit writes a whole autosave
+        self.dirty = set()
+        self.dirty_from = None
+        self.first_change = None
+        self.saved_dir = None
+        self.failed = False
+
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def update(self, grid, level):
+        # called every frame, starts a save on a worker thread when it is time for one
+        if self.busy():
+            return
+        self.retry()
+        if self.first_change is None:
+            return
+        now = time.monotonic()
+        if now - self.last_change < self.delay and now - self.first_change < self.max_delay:
+            return
+        self.start(grid, level)
+
+    def retry(self):
+        # a failed save counts as an edit of the whole level, so it is tried again after the delay
+        if self.failed:
+            self.failed = False
+            self.saved_dir = None
+            self.changed(0)
+
+    def start(self, grid, level):
+        save_dir = levels.autosave_path(self.level_dir, level)
+        chunk_count = levels.autosave_chunk_count(grid.cols)
+        if save_dir != self.saved_dir:
+            chunks = range(chunk_count)
+        else:
+            chunks = self.dirty
+            if self.dirty_from is not None:
+                chunks = chunks.union(range(self.dirty_from, chunk_count))
+            chunks = sorted(i for i in chunks if i < chunk_count)
+        # the worker gets its own copy of the tiles so editing can go on while it writes
+        tiles = grid.tiles.tobytes()
+        self.forget()
+        self.saved_dir = save_dir
+        self.thread = threading.Thread(target=self.save, args=(save_dir, grid.rows, grid.cols, tiles, chunks),
+                                       daemon=True)
+        self.thread.start()
+
+    def save(self, save_dir, rows, cols, tiles, chunks):
+        try:
+            levels.write_autosave(save_dir, rows, cols, tiles, chunks)
+        except OSError as error:
+            # the chunks written are not known, the next save writes all of them
+            print(f"autosave to {save_dir} failed: {error}")
+            self.failed = True
+
+    def save_level(self, grid, level):
+        # write the level files the game loads, also on the worker thread
+        self.wait()
+        self.thread = threading.Thread(target=levels.save_level, args=(self.level_dir, level, list(grid)),
+                                       daemon=True)
+        self.thread.start()
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def flush(self, grid, level):
+        # save what is left and wait for it, for when the editor is closed
+        self.wait()
+        self.retry()
+        if self.first_change is not None:
+            self.start(grid, level)
+            self.wait()
+
@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# runs the game headless over real and generated levels and reports how long each frame phase takes
+
+ROWS = 16
+PERCENTILES = (50, 95, 99)
+# a phase counts as slower when its p95 grows by more than this fraction and this many ms
+REGRESSION_RATIO = 0.1
+REGRESSION_MS = 0.05
+
+
+def make_level(cols, enemies):
+    # flat ground with a low wall every 37 tiles, the player at the start and the enemies spread out
+    data = [[-1] * cols for row in range(ROWS)]
+    for x in range(cols):
+        data[ROWS - 1][x] = 0
+        if x % 37 == 30:
+            data[ROWS - 2][x] = 1
+    data[ROWS - 3][2] = 21
+    # spread the enemies over the columns after the player, stacking them when there are more enemies than columns
+    for i in range(enemies):
+        x = 8 + (i * (cols - 8)) // enemies
+        y = ROWS - 3
+        while data[y][x] != -1:
+            y -= 1
+        data[y][x] = 22
+    return data
+
+
+def write_level(path, data):
+    with open(path, "w") as level_file:
+        for row in data:
+            level_file.write(",".join(str(tile) for tile in row) + "\n")
+
+
+def write_input(path, frames):
+    # walk right, jump over the walls and keep shooting
+    with open(path, "w") as input_file:
+        input_file.write("1 down d\n1 down space\n")
+        for frame in range(10, frames, 40):
+            input_file.write(f"{frame} down w\n{frame + 2} up w\n")
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = min(int(len(ordered) * percent / 100), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_case(level_dir, level, frames, warmup, input_path, out_path):
+    command = [sys.executable, "main.py", "--headless", "--render", "--seed", "0",
+               "--frames", str(frames + warmup), "--level-dir", level_dir, "--level", str(level),
+               "--input", input_path, "--profile-out", out_path]
+    subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+                   stdout=subprocess.DEVNULL)
+    with open(out_path) as timing_file:
+        timing = json.load(timing_file)
+    result = {}
+    for phase, samples in timing["phases"].items():
+        # some phases are not timed every frame, so the warmup is cut by frame and not by sample
+        samples = [ms for frame, ms in zip(timing["frames"][phase], samples) if frame >= warmup]
+        if samples:
+            result[phase] = {f"p{p}": round(percentile(samples, p), 4) for p in PERCENTILES}
+    return result
+
+
+def get_cases(quick):
+    # real levels first, then generated ones growing in length and in enemy count
+    cases = [("level1", None), ("level2", None)]
+    col_counts = [150, 1000] if quick else [150, 1000, 5000, 10000]
+    enemy_counts = [1, 100] if quick else [1, 10, 100, 1000]
+    for cols in col_counts:
+        cases.append((f"cols{cols}_enemies10", (cols, 10)))
+    for enemies in enemy_counts:
+        if enemies != 10:
+            cases.append((f"cols150_enemies{enemies}", (150, enemies)))
+    return cases
+
+
+def compare(old_results, new_results):
+    # print the p95 change of every phase and return the number of regressions
+    regressions = 0
+    for case, phases in new_results["cases"].items():
+        old_phases = old_results["cases"].get(case)
+        if old_phases is None:
+            continue
+        for phase, timing in phases.items():
+            if phase not in old_phases:
+                continue
+            old_p95 = old_phases[phase]["p95"]
+            new_p95 = timing["p95"]
+            change = (new_p95 - old_p95) / old_p95 if old_p95 else 0
+            slower = new_p95 - old_p95 > REGRESSION_MS and change > REGRESSION_RATIO
+            if slower:
+                regressions += 1
+            print(f"{case:24} {phase:14} {old_p95:9.3f} -> {new_p95:9.3f} ms  {change:+7.1%}"
+                  f"{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Platformer frame phase benchmark")
+    parser.add_argument("--frames", type=int, default=600, help="measured frames per case")
+    parser.add_argument("--warmup", type=int, default=30, help="frames ignored at the start of each case")
+    parser.add_argument("--quick", action="store_true", help="run a smaller set of cases")
+    parser.add_argument("--out", default="bench_results.json", help="file to write the results to")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = {"frames": args.frames, "cases": {}}
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_path = os.path.join(temp_dir, "input.txt")
+        write_input(input_path, args.frames + args.warmup)
+        for name, size in get_cases(args.quick):
+            if size is None:
+                level_dir = repo_dir
+                level = int(name[len("level"):])
+            else:
+                level_dir = os.path.join(temp_dir, name)
+                os.mkdir(level_dir)
+                write_level(os.path.join(level_dir, "level1_data.csv"), make_level(*size))
+                level = 1
+            out_path = os.path.join(temp_dir, f"{name}.json")
+            results["cases"][name] = run_case(level_dir, level, args.frames, args.warmup, input_path, out_path)
+            frame = results["cases"][name]["frame"]
+            print(f"{name:24} frame p50 {frame['p50']:8.3f}  p95 {frame['p95']:8.3f}  p99 {frame['p99']:8.3f} ms")
+
+    with open(args.out, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as old_file:
+            old_results = json.load(old_file)
+        if compare(old_results, results):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import math
+
+
+def raycast(blocked, cell_size, x0, y0, x1, y1):
+    # walk the grid cells crossed by the line from (x0, y0) to (x1, y1) in order (a DDA walk),
+    # return the first cell where blocked(col, row) is true or None if the line is clear
+    col = int(x0 // cell_size)
+    row = int(y0 // cell_size)
+    dx = x1 - x0
+    dy = y1 - y0
+    step_col = 1 if dx > 0 else -1
+    step_row = 1 if dy > 0 else -1
+    # how far along the line the next column and row edges are, and the distance between edges,
+    # as fractions of the line length
+    if dx != 0:
+        next_col_at = ((col + (step_col > 0)) * cell_size - x0) / dx
+        col_spacing = cell_size / abs(dx)
+    else:
+        next_col_at = col_spacing = math.inf
+    if dy != 0:
+        next_row_at = ((row + (step_row > 0)) * cell_size - y0) / dy
+        row_spacing = cell_size / abs(dy)
+    else:
+        next_row_at = row_spacing = math.inf
+    while True:
+        if blocked(col, row):
+            return col, row
+        if min(next_col_at, next_row_at) > 1:
+            return None
+        if next_col_at < next_row_at:
+            col += step_col
+            next_col_at += col_spacing
+        else:
+            row += step_row
+            next_row_at += row_spacing
+
+
+# spatial hash for finding the sprites near an area without checking every sprite
+class SpatialHash():
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def clear(self):
+        self.cells.clear()
+
+    def get_cells(self, rect):
+        first_col = rect.left // self.cell_size
+        last_col = (rect.right - 1) // self.cell_size
+        first_row = rect.top // self.cell_size
+        last_row = (rect.bottom - 1) // self.cell_size
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                yield col, row
+
+    def add(self, sprite):
+        for cell in self.get_cells(sprite.rect):
+            if cell in self.cells:
+                self.cells[cell].append(sprite)
+            else:
+                self.cells[cell] = [sprite]
+
+    def query(self, rect):
+        # return the sprites touching the rect in the order they were added
+        found = []
+        for cell in self.get_cells(rect):
+            for sprite in self.cells.get(cell, ()):
+                if sprite not in found and sprite.rect.colliderect(rect):
+                    found.append(sprite)
+        return found
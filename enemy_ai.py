@@ -0,0 +1,316 @@
+import numpy
+import pygame
+
+# the ai state of every enemy lives in arrays so the whole group is advanced with a few numpy
+# operations a frame, sprites are only touched for the enemies that move or change action
+
+# per enemy arrays and their types
+FIELDS = (
+    ("x", numpy.int64),
+    ("y", numpy.int64),
+    ("width", numpy.int64),
+    ("height", numpy.int64),
+    ("speed", numpy.int64),
+    ("direction", numpy.int64),
+    ("flip", numpy.bool_),
+    ("vel_y", numpy.float64),
+    ("in_air", numpy.bool_),
+    ("move_counter", numpy.int64),
+    ("idling", numpy.bool_),
+    ("idling_counter", numpy.int64),
+    ("vision_x", numpy.int64),
+    ("vision_y", numpy.int64),
+    ("vision_width", numpy.int64),
+    ("vision_height", numpy.int64),
+    ("action", numpy.int64),
+    ("tick_phase", numpy.int64),
+)
+
+
+def solid_table(tiles, first, last):
+    # running count of the tiles from first to last down every column, so counting them in a block of rows
+    # is two lookups a column, one byte a tile for levels under 256 rows
+    tiles = numpy.asarray(tiles)
+    solid = (tiles >= first) & (tiles <= last)
+    dtype = numpy.uint8 if solid.shape[0] < 256 else numpy.int32
+    table = numpy.zeros((solid.shape[0] + 1, solid.shape[1]), dtype)
+    numpy.cumsum(solid, 0, dtype=dtype, out=table[1:])
+    return table
+
+
+def count_solid(table, first_row, last_row, first_col, last_col):
+    # number of solid tiles in each block of tiles, the blocks are clipped to the level
+    rows = table.shape[0] - 1
+    cols = table.shape[1]
+    top = numpy.clip(first_row, 0, rows)
+    bottom = numpy.clip(last_row + 1, 0, rows)
+    left = numpy.clip(first_col, 0, cols)
+    right = numpy.clip(last_col + 1, 0, cols)
+    count = numpy.zeros(numpy.broadcast(top, bottom, left, right).shape, numpy.int64)
+    # the blocks are a few columns wide, a column of every block is added at a time
+    for offset in range(int(numpy.max(right - left, initial=0))):
+        col = numpy.minimum(left + offset, cols - 1)
+        column = table[bottom, col].astype(numpy.int64) - table[top, col]
+        count += numpy.where(left + offset < right, column, 0)
+    return numpy.where(bottom > top, count, 0)
+
+
+def round_half_away(values):
+    # pygame rounds like this when a float is added to a rect
+    return numpy.trunc(values + numpy.copysign(0.5, values)).astype(numpy.int64)
+
+
+class EnemyGroup(pygame.sprite.Group):
+    def __init__(self, tile_size, gravity, floor, active_margin, near_distance, near_tick, chase_distance, seed=None):
+        self.tile_size = tile_size
+        self.gravity = gravity
+        # enemies whose feet go below this fall out of the map
+        self.floor = floor
+        # how far from the view enemies are awake every frame, and every near_tick frames
+        self.active_margin = active_margin
+        self.near_distance = near_distance
+        self.near_tick = near_tick
+        # enemies this close to the player try Unit.chase instead of walking with the rest
+        self.chase_distance = chase_distance
+        self.rng = numpy.random.default_rng(seed)
+        self.units = []
+        self.size = 0
+        for name, dtype in FIELDS:
+            setattr(self, name, numpy.zeros(64, dtype))
+        self.walking = numpy.zeros(0, numpy.int64)
+        pygame.sprite.Group.__init__(self)
+
+    def add_internal(self, sprite, layer=None):
+        pygame.sprite.Group.add_internal(self, sprite, layer)
+        if self.size == len(self.x):
+            for name, dtype in FIELDS:
+                setattr(self, name, numpy.resize(getattr(self, name), self.size * 2))
+        i = self.size
+        self.size += 1
+        sprite.ai_slot = i
+        self.units.append(sprite)
+        self.store(sprite, i)
+
+    def store(self, sprite, i):
+        # copy the state of the sprite into its slot
+        self.x[i], self.y[i], self.width[i], self.height[i] = sprite.rect
+        self.vision_x[i], self.vision_y[i], self.vision_width[i], self.vision_height[i] = sprite.vision
+        self.speed[i] = sprite.speed
+        self.direction[i] = sprite.direction
+        self.flip[i] = sprite.flip
+        self.vel_y[i] = sprite.vel_y
+        self.in_air[i] = sprite.in_air
+        self.move_counter[i] = sprite.move_counter
+        self.idling[i] = sprite.idling
+        self.idling_counter[i] = sprite.idling_counter
+        self.action[i] = sprite.action
+        self.tick_phase[i] = sprite.tick_phase
+
+    def remove_internal(self, sprite):
+        pygame.sprite.Group.remove_internal(self, sprite)
+        # hand the state back to the sprite, then fill the gap with the last enemy
+        i = sprite.ai_slot
+        self.restore(sprite, i)
+        last = self.size - 1
+        if i != last:
+            for name, dtype in FIELDS:
+                array = getattr(self, name)
+                array[i] = array[last]
+            self.units[i] = self.units[last]
+            self.units[i].ai_slot = i
+        self.units.pop()
+        self.size -= 1
+        self.walking = numpy.zeros(0, numpy.int64)
+
+    def restore(self, sprite, i):
+        # copy the state kept only in the arrays back to the sprite
+        sprite.vel_y = float(self.vel_y[i])
+        sprite.in_air = bool(self.in_air[i])
+        sprite.move_counter = int(self.move_counter[i])
+        sprite.idling = bool(self.idling[i])
+        sprite.idling_counter = int(self.idling_counter[i])
+        sprite.vision.topleft = (int(self.vision_x[i]), int(self.vision_y[i]))
+
+    def ai(self, player, world, view, frame):
+        # one frame of Unit.ai for the enemies that are awake
+        # returns the awake enemies, the ones near the view are awake every frame,
+        # the ones a little further away every few frames and the rest sleep
+        n = self.size
+        self.walking = numpy.zeros(0, numpy.int64)
+        x = self.x[:n]
+        distance = numpy.maximum(numpy.maximum(view.x - (x + self.width[:n]), x - view.right), 0)
+        awake = numpy.flatnonzero((distance <= self.active_margin) |
+                                  ((distance <= self.near_distance) &
+                                   ((frame + self.tick_phase[:n]) % self.near_tick == 0)))
+        units = self.units
+        if not player.alive:
+            return [units[i] for i in awake.tolist()]
+        idling = self.idling[awake]
+        idling_counter = self.idling_counter[awake]
+        action = self.action[awake]
+
+        # now and then an enemy stops for a while
+        start_idle = ~idling & (self.rng.integers(1, 201, len(awake)) == 1)
+        for i in awake[start_idle].tolist():
+            units[i].update_action(0)  # 0 for idle
+        action[start_idle] = 0
+        idling[start_idle] = True
+        idling_counter[start_idle] = 50
+
+        # enemies that can see the player stop and shoot, only the few with the player
+        # in their vision box cast a ray to check for walls
+        vision_x = self.vision_x[awake]
+        vision_y = self.vision_y[awake]
+        seeing = ((vision_x < player.rect.right) & (player.rect.x < vision_x + self.vision_width[awake]) &
+                  (vision_y < player.rect.bottom) & (player.rect.y < vision_y + self.vision_height[awake]))
+        for j in numpy.flatnonzero(seeing).tolist():
+            seeing[j] = world.line_of_sight(units[awake[j]].rect.center, player.rect.center)
+        for i in awake[seeing].tolist():
+            units[i].update_action(0)  # 0 for idle
+            units[i].update_action(4)  # 4 for attack
+            units[i].shoot()
+        action[seeing] = 4
+
+        # the rest either walk or wait for their idle time to run out
+        walking = ~seeing & ~idling
+        waiting = ~seeing & idling
+        idling_counter[waiting] -= 1
+        idling[waiting & (idling_counter <= 0)] = False
+
+        # the few walkers close to the player go after it one by one, the ones that cannot reach it
+        # walk with the rest
+        centre_x = x[awake] + self.width[awake] // 2
+        chasing = walking & (numpy.abs(centre_x - player.rect.centerx) <= self.chase_distance)
+        for j in numpy.flatnonzero(chasing).tolist():
+            i = awake[j]
+            self.restore(units[i], i)
+            chasing[j] = units[i].chase()
+            if chasing[j]:
+                self.store(units[i], i)
+                action[j] = units[i].action
+        walking &= ~chasing
+        self.walking = awake[walking]
+        self.move(self.walking, world.solid_table)
+        # the ones that stop in the air keep falling
+        airborne = self.in_air[awake] | (self.vel_y[awake] > self.gravity)
+        self.drop(awake[~walking & ~chasing & airborne], world.solid_table)
+        for i in awake[walking & (action != 1)].tolist():
+            units[i].update_action(1)  # 1 for move
+        action[walking] = 1
+
+        self.idling[awake] = idling
+        self.idling_counter[awake] = idling_counter
+        self.action[awake] = action
+        return [units[i] for i in awake.tolist()]
+
+    def move(self, walking, table):
+        # Unit.move for the walking enemies
+        size = self.tile_size
+        x = self.x[walking]
+        y = self.y[walking]
+        width = self.width[walking]
+        height = self.height[walking]
+        old_direction = self.direction[walking]
+        direction = old_direction.copy()
+        move_counter = self.move_counter[walking]
+        dx = direction * self.speed[walking]
+        vel_y = self.vel_y[walking] + self.gravity
+        in_air = self.in_air[walking]
+
+        # walls only stop the enemy, it still turns around on its move counter
+        blocked = count_solid(table, y // size, (y + height - 1) // size,
+                              (x + dx) // size, (x + dx + width - 1) // size) > 0
+        dx[blocked] = 0
+        dy = self.fall(x, y, width, height, vel_y, in_air, table)
+
+        # check if fallen out the map
+        for i in walking[y + height > self.floor].tolist():
+            self.units[i].health = 0
+
+        new_x = x + dx
+        new_y = round_half_away(y + dy)
+        move_counter += 1
+        # update ai vision as enemy moves
+        vision_width = self.vision_width[walking]
+        self.vision_x[walking] = new_x + width // 2 + (vision_width // 2) * direction - vision_width // 2
+        self.vision_y[walking] = new_y + height // 2 - self.vision_height[walking] // 2
+        # turn around after walking a tile
+        turn = move_counter > size
+        direction[turn] *= -1
+        move_counter[turn] *= -1
+
+        # only the sprites that moved or turned are written to
+        units = self.units
+        moved = (new_x != x) | (new_y != y)
+        for i, rect_x, rect_y in zip(walking[moved].tolist(), new_x[moved].tolist(), new_y[moved].tolist()):
+            units[i].rect.topleft = (rect_x, rect_y)
+        flip = old_direction != 1
+        turned = (direction != old_direction) | (flip != self.flip[walking])
+        for i, new_direction, new_flip in zip(walking[turned].tolist(), direction[turned].tolist(),
+                                              flip[turned].tolist()):
+            units[i].direction = new_direction
+            units[i].flip = new_flip
+
+        self.x[walking] = new_x
+        self.y[walking] = new_y
+        self.direction[walking] = direction
+        self.flip[walking] = flip
+        self.vel_y[walking] = vel_y
+        self.in_air[walking] = in_air
+        self.move_counter[walking] = move_counter
+
+    def drop(self, falling, table):
+        # Unit.move without walking, for the enemies in the air that stopped to shoot or wait
+        x = self.x[falling]
+        y = self.y[falling]
+        height = self.height[falling]
+        vel_y = self.vel_y[falling] + self.gravity
+        in_air = self.in_air[falling]
+        dy = self.fall(x, y, self.width[falling], height, vel_y, in_air, table)
+        for i in falling[y + height > self.floor].tolist():
+            self.units[i].health = 0
+        new_y = round_half_away(y + dy)
+        moved = new_y != y
+        for i, rect_y in zip(falling[moved].tolist(), new_y[moved].tolist()):
+            self.units[i].rect.y = rect_y
+        self.y[falling] = new_y
+        self.vel_y[falling] = vel_y
+        self.in_air[falling] = in_air
+
+    def fall(self, x, y, width, height, vel_y, in_air, table):
+        # the vertical part of a move, returns dy and updates vel_y and in_air in place
+        # a tile hit on the way down is landed on and one hit on the way up stops the jump,
+        # the lowest one wins like the last tile Unit.move looks at
+        size = self.tile_size
+        dy = vel_y.copy()
+        new_top = numpy.trunc(y + dy).astype(numpy.int64)
+        first_row = new_top // size
+        last_row = (new_top + height - 1) // size
+        first_col = x // size
+        last_col = (x + width - 1) // size
+        hit_row = numpy.full(len(x), -1, numpy.int64)
+        span = int((last_row - first_row).max(initial=0)) + 1
+        for offset in range(span):
+            row = last_row - offset
+            found = (hit_row < 0) & (row >= first_row) & (count_solid(table, row, row, first_col, last_col) > 0)
+            hit_row[found] = row[found]
+        hit = hit_row >= 0
+        rising = vel_y < 0
+        landed = hit & ~rising
+        bumped = hit & rising
+        vel_y[hit] = 0
+        in_air[landed] = False
+        dy = numpy.where(landed, hit_row * size - (y + height), dy)
+        return numpy.where(bumped, (hit_row + 1) * size - y, dy)
+
+    def draw_vision(self, surface, colour, camera):
+        # the vision boxes of the enemies that walked this frame
+        walking = self.walking
+        view = camera.get_view()
+        vision_x = self.vision_x[walking]
+        vision_width = self.vision_width[walking]
+        shown = (vision_x < view.right) & (vision_x + vision_width > view.x)
+        for i in walking[shown].tolist():
+            vision = pygame.Rect(int(self.vision_x[i]), int(self.vision_y[i]),
+                                 int(self.vision_width[i]), int(self.vision_height[i]))
+            pygame.draw.rect(surface, colour, camera.apply(vision))
@@ -0,0 +1,212 @@
+from array import array
+from collections import deque
+
+# undo steps kept, each one only holds the tiles it changed
+HISTORY_SIZE = 200
+
+
+# the level tiles as one array of signed bytes, row by row, with undo and redo
+# every change is written down as the old and new values of a run of tiles, or as the columns
+# inserted or deleted, and the changes made since the last commit() are undone together
+class LevelGrid():
+    def __init__(self, rows, cols, tiles=None):
+        self.rows = rows
+        self.cols = cols
+        self.tiles = tiles if tiles is not None else array("b", [-1]) * (rows * cols)
+        self.undo_steps = deque(maxlen=HISTORY_SIZE)
+        self.redo_steps = []
+        self.pending = []
+        # first and last column changed by anything but set(), None for up to the end
+        self.dirty = None
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, y):
+        # a copy of one row, so the grid can be used where a list of rows is expected
+        if not 0 <= y < self.rows:
+            raise IndexError(y)
+        start = y * self.cols
+        return self.tiles[start:start + self.cols]
+
+    def columns(self, x, count):
+        # the rows of count columns from x, only those tiles are copied
+        count = min(count, self.cols - x)
+        return [self.tiles[y * self.cols + x:y * self.cols + x + count] for y in range(self.rows)]
+
+    def get(self, x, y):
+        return self.tiles[y * self.cols + x]
+
+    def set(self, x, y, tile):
+        # the caller redraws a cell changed here, it is not marked dirty
+        self.replace(y * self.cols + x, array("b", [tile]))
+
+    def replace(self, start, values):
+        # write values over the tiles from start and keep the old ones for undo
+        end = start + len(values)
+        old = self.tiles[start:end]
+        if old != values:
+            self.pending.append(("cells", start, old, values))
+            self.tiles[start:end] = values
+
+    def mark_dirty(self, first_col, last_col):
+        if self.dirty is None:
+            self.dirty = (first_col, last_col)
+        else:
+            old_first, old_last = self.dirty
+            if old_last is None or last_col is None:
+                last_col = None
+            else:
+                last_col = max(old_last, last_col)
+            self.dirty = (min(old_first, first_col), last_col)
+
+    def take_dirty(self):
+        dirty = self.dirty
+        self.dirty = None
+        return dirty
+
+    def clip_rect(self, x0, y0, x1, y1):
+        # order the corners and keep them inside the level
+        x0, x1 = max(min(x0, x1), 0), min(max(x0, x1), self.cols - 1)
+        y0, y1 = max(min(y0, y1), 0), min(max(y0, y1), self.rows - 1)
+        return x0, y0, x1, y1
+
+    def fill_rect(self, x0, y0, x1, y1, tile):
+        x0, y0, x1, y1 = self.clip_rect(x0, y0, x1, y1)
+        if x0 > x1 or y0 > y1:
+            return
+        values = array("b", [tile]) * (x1 - x0 + 1)
+        for y in range(y0, y1 + 1):
+            self.replace(y * self.cols + x0, values)
+        self.mark_dirty(x0, x1)
+
+    def flood_fill(self, x, y, tile):
+        # fill the area of same tiles around x, y a row span at a time
+        tiles = self.tiles
+        cols = self.cols
+        target = tiles[y * cols + x]
+        if target == tile:
+            return
+        seeds = [(x, y)]
+        while seeds:
+            x, y = seeds.pop()
+            row = y * cols
+            if tiles[row + x] != target:
+                continue
+            left = x
+            while left > 0 and tiles[row + left - 1] == target:
+                left -= 1
+            right = x
+            while right < cols - 1 and tiles[row + right + 1] == target:
+                right += 1
+            self.replace(row + left, array("b", [tile]) * (right - left + 1))
+            self.mark_dirty(left, right)
+            # one seed for every run of the same tile above and below the span
+            for next_y in (y - 1, y + 1):
+                if 0 <= next_y < self.rows:
+                    next_row = next_y * cols
+                    in_run = False
+                    for next_x in range(left, right + 1):
+                        if tiles[next_row + next_x] == target:
+                            if not in_run:
+                                seeds.append((next_x, next_y))
+                                in_run = True
+                        else:
+                            in_run = False
+
+    def copy(self, x0, y0, x1, y1):
+        # returns (width, height, tiles) of the rectangle
+        x0, y0, x1, y1 = self.clip_rect(x0, y0, x1, y1)
+        width = x1 - x0 + 1
+        clip = array("b")
+        for y in range(y0, y1 + 1):
+            start = y * self.cols + x0
+            clip.extend(self.tiles[start:start + width])
+        return width, y1 - y0 + 1, clip
+
+    def paste(self, clip, x, y):
+        # put a copied rectangle with its top left at x, y, the part outside the level is dropped
+        width, height, clip_tiles = clip
+        first = max(-x, 0)
+        last = min(width, self.cols - x)
+        if first >= last:
+            return
+        for row in range(max(-y, 0), min(height, self.rows - y)):
+            start = row * width
+            self.replace((y + row) * self.cols + x + first, clip_tiles[start + first:start + last])
+        self.mark_dirty(x + first, x + last - 1)
+
+    def insert_columns(self, x, count, tile=-1):
+        columns = array("b", [tile]) * (self.rows * count)
+        self.put_columns(x, columns)
+        self.pending.append(("insert", x, columns))
+
+    def delete_columns(self, x, count):
+        self.pending.append(("delete", x, self.take_columns(x, count)))
+
+    def put_columns(self, x, columns):
+        # columns holds the new tiles row by row
+        count = len(columns) // self.rows
+        for y in reversed(range(self.rows)):
+            start = y * self.cols + x
+            self.tiles[start:start] = columns[y * count:(y + 1) * count]
+        self.cols += count
+        self.mark_dirty(x, None)
+
+    def take_columns(self, x, count):
+        # remove the columns and return their tiles row by row
+        columns = array("b")
+        for y in range(self.rows):
+            start = y * self.cols + x
+            columns.extend(self.tiles[start:start + count])
+        for y in reversed(range(self.rows)):
+            start = y * self.cols + x
+            del self.tiles[start:start + count]
+        self.cols -= count
+        self.mark_dirty(x, None)
+        return columns
+
+    def commit(self):
+        # close the changes made so far into one undo step
+        if self.pending:
+            self.undo_steps.append(self.pending)
+            self.redo_steps.clear()
+            self.pending = []
+
+    def clear_history(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.pending = []
+
+    def undo(self):
+        self.commit()
+        if self.undo_steps:
+            step = self.undo_steps.pop()
+            for change in reversed(step):
+                self.apply(change, False)
+            self.redo_steps.append(step)
+
+    def redo(self):
+        if self.redo_steps:
+            step = self.redo_steps.pop()
+            for change in step:
+                self.apply(change, True)
+            self.undo_steps.append(step)
+
+    def apply(self, change, forward):
+        kind = change[0]
+        if kind == "cells":
+            kind, start, old, new = change
+            self.tiles[start:start + len(old)] = new if forward else old
+            first_col = start % self.cols
+            self.mark_dirty(first_col, first_col + len(old) - 1)
+        elif (kind == "insert") == forward:
+            self.put_columns(change[1], change[2])
+        else:
+            self.take_columns(change[1], len(change[2]) // self.rows)
+
+
+def from_view(view):
+    # a grid of a rows x cols tile view, like the ones levels.load_level returns
+    rows, cols = view.shape
+    return LevelGrid(rows, cols, array("b", view.tobytes()))
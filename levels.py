@@ -0,0 +1,187 @@
+import csv
+import io
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# binary level files hold a header and then one signed byte per tile, row by row
+LEVEL_MAGIC = b"PLVL"
+LEVEL_VERSION = 1
+HEADER = struct.Struct("<4sHHI")  # magic, version, rows, cols
+# autosaves are a directory with the tiles split into files of this many columns and a header naming the
+# file of every chunk, a save writes new files and then replaces the header so a save cut short leaves the last one
+AUTOSAVE_CHUNK_COLS = 256
+AUTOSAVE_MAGIC = b"PSAV"
+AUTOSAVE_VERSION = 1
+# magic, version, rows, cols, generation of the save, followed by the generation of the file of every chunk
+AUTOSAVE_HEADER = struct.Struct("<4sHHII")
+
+
+def level_path(level_dir, level, extension):
+    return os.path.join(level_dir, f"level{level}_data.{extension}")
+
+
+def autosave_path(level_dir, level):
+    return os.path.join(level_dir, f"level{level}_autosave")
+
+
+def write_file(path, data):
+    # write to a temporary file and move it over path, so path always holds a whole file
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as out_file:
+        out_file.write(data)
+        out_file.flush()
+        os.fsync(out_file.fileno())
+    os.replace(temp_path, path)
+
+
+def to_tile_array(rows):
+    # pack a list of rows into a rows x cols view of signed bytes
+    tiles = array("b")
+    for row in rows:
+        tiles.extend(row)
+    return memoryview(tiles).cast("B").cast("b", (len(rows), len(rows[0])))
+
+
+def read_csv(path):
+    with open(path, newline="") as csvfile:
+        reader = csv.reader(csvfile, delimiter=",")
+        return to_tile_array([[int(tile) for tile in row] for row in reader])
+
+
+def write_csv(path, rows):
+    csvfile = io.StringIO(newline="")
+    writer = csv.writer(csvfile, delimiter=",")
+    for row in rows:
+        writer.writerow(row)
+    write_file(path, csvfile.getvalue().encode())
+
+
+def read_binary(path):
+    # map the file instead of reading it, the tiles are only paged in when used
+    with open(path, "rb") as level_file:
+        buffer = mmap.mmap(level_file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, rows, cols = HEADER.unpack_from(buffer)
+    if magic != LEVEL_MAGIC or version != LEVEL_VERSION:
+        raise ValueError(f"{path} is not a version {LEVEL_VERSION} level file")
+    return memoryview(buffer)[HEADER.size:HEADER.size + rows * cols].cast("b", (rows, cols))
+
+
+def write_binary(path, rows):
+    # the game maps level files, so they are replaced instead of written over
+    header = HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, len(rows), len(rows[0]))
+    write_file(path, header + b"".join(array("b", row).tobytes() for row in rows))
+
+
+def chunk_path(save_dir, index, generation):
+    # every save writes its chunks under its own generation, the files of the last save are never written over
+    return os.path.join(save_dir, f"chunk{index}_{generation}.bin")
+
+
+def autosave_chunk_count(cols):
+    return (cols + AUTOSAVE_CHUNK_COLS - 1) // AUTOSAVE_CHUNK_COLS
+
+
+def read_autosave_header(save_dir):
+    # returns rows, cols, the generation of the save and the generation of every chunk file
+    with open(os.path.join(save_dir, "header.bin"), "rb") as header_file:
+        data = header_file.read()
+    if len(data) < AUTOSAVE_HEADER.size:
+        raise ValueError(f"{save_dir} is not a version {AUTOSAVE_VERSION} autosave")
+    magic, version, rows, cols, generation = AUTOSAVE_HEADER.unpack_from(data)
+    generations = array("I")
+    generations.frombytes(data[AUTOSAVE_HEADER.size:])
+    if magic != AUTOSAVE_MAGIC or version != AUTOSAVE_VERSION or len(generations) != autosave_chunk_count(cols):
+        raise ValueError(f"{save_dir} is not a version {AUTOSAVE_VERSION} autosave")
+    return rows, cols, generation, generations
+
+
+def write_autosave(save_dir, rows, cols, tiles, chunks):
+    # tiles is the whole level as bytes, row by row, the listed chunks are written and the rest are kept
+    # from the last save, chunks that do not fit the last save are written too
+    os.makedirs(save_dir, exist_ok=True)
+    try:
+        old_rows, old_cols, generation, generations = read_autosave_header(save_dir)
+    except (OSError, ValueError):
+        old_rows, old_cols, generation, generations = None, 0, 0, array("I")
+    # the chunks of the last save that are still whole and in the same place
+    if old_rows != rows:
+        kept = 0
+    elif old_cols == cols:
+        kept = len(generations)
+    else:
+        kept = min(old_cols, cols) // AUTOSAVE_CHUNK_COLS
+    generation += 1
+    generations = generations[:kept] + array("I", [generation]) * (autosave_chunk_count(cols) - kept)
+    chunks = set(chunks)
+    for i in range(autosave_chunk_count(cols)):
+        if i in chunks or generations[i] == generation:
+            generations[i] = generation
+            first = i * AUTOSAVE_CHUNK_COLS
+            last = min(first + AUTOSAVE_CHUNK_COLS, cols)
+            write_file(chunk_path(save_dir, i, generation),
+                       b"".join(tiles[y * cols + first:y * cols + last] for y in range(rows)))
+    # replacing the header switches to the new save in one step, then the files it does not name are removed
+    write_file(os.path.join(save_dir, "header.bin"),
+               AUTOSAVE_HEADER.pack(AUTOSAVE_MAGIC, AUTOSAVE_VERSION, rows, cols, generation) + generations.tobytes())
+    used = {os.path.basename(chunk_path(save_dir, i, chunk_generation))
+            for i, chunk_generation in enumerate(generations)}
+    for name in os.listdir(save_dir):
+        if name.startswith("chunk") and name not in used:
+            os.remove(os.path.join(save_dir, name))
+
+
+def autosave_time(save_dir):
+    header_path = os.path.join(save_dir, "header.bin")
+    return os.path.getmtime(header_path) if os.path.exists(header_path) else None
+
+
+def read_autosave(save_dir):
+    rows, cols, generation, generations = read_autosave_header(save_dir)
+    tiles = array("b", [-1]) * (rows * cols)
+    for i, chunk_generation in enumerate(generations):
+        first = i * AUTOSAVE_CHUNK_COLS
+        width = min(AUTOSAVE_CHUNK_COLS, cols - first)
+        path = chunk_path(save_dir, i, chunk_generation)
+        with open(path, "rb") as chunk_file:
+            data = chunk_file.read()
+        if len(data) != rows * width:
+            raise ValueError(f"{path} does not match the autosave header")
+        for y in range(rows):
+            tiles[y * cols + first:y * cols + first + width] = array("b", data[y * width:(y + 1) * width])
+    return memoryview(tiles).cast("B").cast("b", (rows, cols))
+
+
+def level_exists(level_dir, level):
+    return os.path.exists(level_path(level_dir, level, "csv")) or os.path.exists(level_path(level_dir, level, "lvl"))
+
+
+def load_level(level_dir, level):
+    # use the binary file unless the csv has been edited since it was written
+    csv_path = level_path(level_dir, level, "csv")
+    binary_path = level_path(level_dir, level, "lvl")
+    if os.path.exists(binary_path) and (not os.path.exists(csv_path) or
+                                        os.path.getmtime(binary_path) >= os.path.getmtime(csv_path)):
+        return read_binary(binary_path)
+    return read_csv(csv_path)
+
+
+def save_level(level_dir, level, rows):
+    write_csv(level_path(level_dir, level, "csv"), rows)
+    write_binary(level_path(level_dir, level, "lvl"), rows)
+
+
+def convert(csv_path):
+    binary_path = os.path.splitext(csv_path)[0] + ".lvl"
+    write_binary(binary_path, read_csv(csv_path).tolist())
+    return binary_path
+
+
+if __name__ == "__main__":
+    # convert the csv files given, or every level csv in this folder
+    paths = sys.argv[1:] or sorted(name for name in os.listdir(".")
+                                   if name.startswith("level") and name.endswith("_data.csv"))
+    for path in paths:
+        print(f"{path} -> {convert(path)}")
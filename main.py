@@ -2,8 +2,51 @@ import pygame
 from pygame import mixer
 import os
 import random
-import csv
+import time
+import argparse
+import threading
+from collections import OrderedDict
 import button
+import collision
+import tilemap
+import parallax
+import profiler
+import levels
+import pool
+import screen_updates
+import audio
+import assets
+import navigation
+# the batched enemy ai needs numpy, without it every enemy runs Unit.ai on its own
+try:
+    import enemy_ai
+except ImportError:
+    enemy_ai = None
+
+# command line options
+parser = argparse.ArgumentParser(description="Platformer")
+parser.add_argument("--headless", action="store_true",
+                    help="run without a window or sound, as fast as possible")
+parser.add_argument("--render", action="store_true", help="still draw every frame in headless mode")
+parser.add_argument("--frames", type=int, default=0, help="quit after this many frames")
+parser.add_argument("--input", help="file of scripted key presses, one '<frame> <down|up> <key>' per line")
+parser.add_argument("--level", type=int, default=1, help="level to start on")
+parser.add_argument("--level-dir", default=".", help="folder with the level files")
+parser.add_argument("--seed", type=int, help="seed for the enemy ai")
+parser.add_argument("--profile", action="store_true", help="start with the frame profiler overlay shown (F3)")
+parser.add_argument("--profile-out", help="write the time of each frame phase to this json file")
+parser.add_argument("--build-assets", action="store_true",
+                    help="pack every image scaled and ready to use into assets.bundle, then quit")
+args = parser.parse_args()
+headless = args.headless
+draw_frames = not headless or args.render
+
+if headless:
+    # the dummy drivers work on machines without a display or sound card
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+if args.seed is not None:
+    random.seed(args.seed)
 
 mixer.init()
 pygame.init()
@@ -22,14 +65,24 @@ FPS = 60
 GRAVITY = 0.75
 SCROLL_THRESH = 200
 ROWS = 16
-COLS = 150
 TILE_SIZE = screen_height // ROWS
 TILE_TYPES = 27
+# chunks loaded on each side of the screen, and how far away they are dropped again
+LOAD_CHUNKS = 1
+EVICT_CHUNKS = 3
+# enemies this close to the screen update every frame, the ones closer than NEAR_DISTANCE
+# every NEAR_TICK frames and the rest sleep
+ACTIVE_MARGIN = TILE_SIZE
+NEAR_DISTANCE = tilemap.CHUNK_COLS * TILE_SIZE
+NEAR_TICK = 4
+# enemies this close to the player go after it along the level's navigation graph, they look for
+# a new path every REPATH_FRAMES frames and give up on paths that cost more than CHASE_COST tiles
+CHASE_DISTANCE = 8 * TILE_SIZE
+REPATH_FRAMES = 30
+CHASE_COST = 20
 MAX_LEVELS = 2
-screen_scroll = 0
-bg_scroll = 0
-level = 1
-start_game = False
+level = args.level
+start_game = headless
 start_intro = False
 
 # Define player action variables
@@ -43,37 +96,40 @@ grenade_thrown = False
 pygame.mixer.music.load("Audio/game_music.mp3")
 pygame.mixer.music.set_volume(0.2)
 pygame.mixer.music.play(-1, 0.0, 5000)
-jump_fx = pygame.mixer.Sound("Audio/jump.wav")
-jump_fx.set_volume(0.1)
-shot_fx = pygame.mixer.Sound("Audio/audio_shot.wav")
-shot_fx.set_volume(0.1)
-grenade_fx = pygame.mixer.Sound("Audio/grenade.wav")
-grenade_fx.set_volume(0.1)
+# sound effects play on a few voices each, the player's win over the enemies' when they run out,
+# and nothing further than SOUND_DISTANCE from the screen is heard
+SOUND_DISTANCE = screen_width // 2
+PLAYER_SOUND = 1
+sounds = audio.SoundManager(lambda: camera.get_view(), SOUND_DISTANCE)
+sounds.add("jump", "Audio/jump.wav", 0.1, 1)
+sounds.add("shot", "Audio/audio_shot.wav", 0.1, 4)
+sounds.add("grenade", "Audio/grenade.wav", 0.1, 2)
 
 # load images
+# they come from assets.bundle when it has been built, otherwise from their files
+bundle = assets.AssetBundle("assets.bundle")
 # buttons images
-start_img = pygame.image.load("Images/Buttons/start.png").convert_alpha()
-exit_img = pygame.image.load("Images/Buttons/exit.png").convert_alpha()
-restart_img = pygame.image.load("Images/Buttons/restart.png").convert_alpha()
+start_img = bundle.image("Images/Buttons/start.png")
+exit_img = bundle.image("Images/Buttons/exit.png")
+restart_img = bundle.image("Images/Buttons/restart.png")
 # background
-sky_image = pygame.image.load("Images/Background/sky_cloud1.png").convert_alpha()
-mountains_image = pygame.image.load("Images/Background/mountains.png").convert_alpha()
-forest_image = pygame.image.load("Images/Background/forest.png").convert_alpha()
+sky_image = bundle.image("Images/Background/sky_cloud1.png")
+mountains_image = bundle.image("Images/Background/mountains.png")
+forest_image = bundle.image("Images/Background/forest.png")
 # store tiles in a list
 img_list = []
 for x in range(TILE_TYPES):
-    img = pygame.image.load(f"Images/Tiles/{x}.png")
-    img = pygame.transform.scale(img, (TILE_SIZE, TILE_SIZE))
+    img = bundle.image(f"Images/Tiles/{x}.png", (TILE_SIZE, TILE_SIZE))
     img_list.append(img)
 # bullet
-bullet_img = pygame.image.load("Images/Icons/acorn.png").convert_alpha()
-hat_img = pygame.image.load("Images/Icons/hat.png").convert_alpha()
+bullet_img = bundle.image("Images/Icons/acorn.png")
+hat_img = bundle.image("Images/Icons/hat.png")
 # grenade
-grenade_img = pygame.image.load("Images/Icons/grenade.png").convert_alpha()
+grenade_img = bundle.image("Images/Icons/grenade.png")
 # itemboxes
-health_box_img = pygame.image.load("Images/Icons/health_box.png").convert_alpha()
-ammo_box_img = pygame.image.load("Images/Icons/ammo_box.png").convert_alpha()
-grenade_box_img = pygame.image.load("Images/Icons/grenade_box.png").convert_alpha()
+health_box_img = bundle.image("Images/Icons/health_box.png")
+ammo_box_img = bundle.image("Images/Icons/ammo_box.png")
+grenade_box_img = bundle.image("Images/Icons/grenade_box.png")
 item_boxes = {
     "Health": health_box_img,
     "Ammo": ammo_box_img,
@@ -88,20 +144,102 @@ GREEN = (59, 142, 96)
 BLACK = (0, 0, 0)
 GRAY = (191, 213, 232)
 font = pygame.font.SysFont("Futura", 30)
+profiler_font = pygame.font.SysFont("Futura", 18)
 
 
-def draw_text(text, font, text_col, x, y):
+# rendered text is kept so the same text is not rendered again every frame,
+# the least recently used is dropped when full
+TEXT_CACHE_SIZE = 64
+text_cache = OrderedDict()
+
+
+def render_text(text, font, text_col):
+    key = (text, font, text_col)
+    if key in text_cache:
+        text_cache.move_to_end(key)
+        return text_cache[key]
     img = font.render(text, True, text_col)
-    screen.blit(img, (x, y))
+    text_cache[key] = img
+    if len(text_cache) > TEXT_CACHE_SIZE:
+        text_cache.popitem(last=False)
+    return img
+
+
+def draw_text(text, font, text_col, x, y, surface=None):
+    if surface is None:
+        surface = screen
+    surface.blit(render_text(text, font, text_col), (x, y))
+
+
+# create background layers
+background = parallax.ParallaxBackground((screen_width, screen_height), BG)
+background.add_layer(sky_image, 0.3, 0)
+background.add_layer(mountains_image, 0.6, screen_height - mountains_image.get_height() - 30)
+background.add_layer(forest_image, 0.8, screen_height - forest_image.get_height())
 
 
 def draw_bg():
-    screen.fill(BG)
-    width = sky_image.get_width()
-    for x in range(5):
-        screen.blit(sky_image, ((x * width) - bg_scroll * 0.3, 0))
-        screen.blit(mountains_image, ((x * width) - bg_scroll * 0.6, screen_height - mountains_image.get_height() - 30))
-        screen.blit(forest_image, ((x * width) - bg_scroll * 0.8, screen_height - forest_image.get_height()))
+    background.draw(screen, camera.x)
+
+
+def draw_group(group):
+    # draw the sprites inside the camera view at their screen position
+    view = camera.get_view()
+    for sprite in group:
+        if sprite.rect.colliderect(view):
+            screen.blit(sprite.image, camera.apply(sprite.rect))
+
+
+# function to check projectiles against characters
+def check_projectile_hits():
+    # rebuild the hash of living characters once per frame
+    unit_hash.clear()
+    if player.alive:
+        unit_hash.add(player)
+    for enemy in awake_enemies:
+        if enemy.alive:
+            unit_hash.add(enemy)
+    # each projectile damages the first character it touches, then it is removed
+    for group, player_damage, enemy_damage in ((bullet_group, 5, 25), (grenade_group, 5, 50)):
+        for projectile in group:
+            hits = unit_hash.query(projectile.rect)
+            if hits:
+                if hits[0] is player:
+                    player.health -= player_damage
+                else:
+                    hits[0].health -= enemy_damage
+                projectile.kill()
+
+
+# function to check if an enemy updates this frame, EnemyGroup.ai does the same for all of them at once
+def enemy_awake(enemy, view, frame):
+    distance = max(view.x - enemy.rect.right, enemy.rect.x - view.right, 0)
+    return distance <= ACTIVE_MARGIN or (distance <= NEAR_DISTANCE and (frame + enemy.tick_phase) % NEAR_TICK == 0)
+
+
+def load_input_script(path):
+    # read scripted key presses into a dict of frame number to key events
+    script = {}
+    with open(path) as script_file:
+        for line in script_file:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            frame, state, key = line.split()
+            event_type = pygame.KEYDOWN if state == "down" else pygame.KEYUP
+            event = pygame.event.Event(event_type, key=pygame.key.key_code(key))
+            script.setdefault(int(frame), []).append(event)
+    return script
+
+
+# function to swap in a level and start preparing the one after it
+def load_world(level):
+    reset_level()
+    world, player, health_bar = preloader.take(level)
+    world.activate()
+    if preloader.level != level + 1:
+        preloader.start(level + 1)
+    return world, player, health_bar
 
 
 # function to reset level
@@ -114,13 +252,61 @@ def reset_level():
     decoration_group.empty()
     exit_group.empty()
 
-    # create empty tile list
-    data = []
-    for row in range(ROWS):
-        r = [-1] * COLS
-        data.append(r)
 
-    return data
+# scaled animation frames and their mirrored copies shared by all units,
+# the least recently used are dropped when full
+# the level preloader thread also uses the cache, so it is locked
+ANIMATION_CACHE_SIZE = 32
+ANIMATION_TYPES = ["Idle", "Move", "Jump", "Death", "Attack"]
+animation_cache = OrderedDict()
+animation_lock = threading.Lock()
+
+
+def load_animation(char_type, animation, scale):
+    key = (char_type, animation, scale)
+    with animation_lock:
+        if key in animation_cache:
+            animation_cache.move_to_end(key)
+            return animation_cache[key]
+        temp_list = []
+        flipped_list = []
+        # count number of files in the folder
+        num_of_frames = len(os.listdir(f"Images/{char_type}/{animation}/"))
+        num_of_frames -= 1
+        for i in range(num_of_frames):
+            img = bundle.image(f"Images/{char_type}/{animation}/{i}.png", scale=scale)
+            temp_list.append(img)
+            flipped_list.append(pygame.transform.flip(img, True, False))
+        animation_cache[key] = (temp_list, flipped_list)
+        if len(animation_cache) > ANIMATION_CACHE_SIZE:
+            animation_cache.popitem(last=False)
+        return temp_list, flipped_list
+
+
+# explosion frames for each scale, loaded the first time they are needed and shared by every explosion
+explosion_frames = {}
+
+
+def load_explosion(scale):
+    if scale not in explosion_frames:
+        images = []
+        for num in range(1, 5):
+            images.append(bundle.image(f"Images/Explosion/exp{num}.png", scale=scale))
+        explosion_frames[scale] = images
+    return explosion_frames[scale]
+
+
+# load every image the game can use and pack them into the bundle
+if args.build_assets:
+    for char_type in ("Dale", "Enemy"):
+        for animation in ANIMATION_TYPES:
+            load_animation(char_type, animation, 3)
+    if os.path.isdir("Images/Explosion"):
+        load_explosion(0.5)
+    bundle.save()
+    print(f"packed {len(bundle.images)} images into {bundle.path}")
+    pygame.quit()
+    raise SystemExit
 
 
 class Unit(pygame.sprite.Sprite):
@@ -141,6 +327,7 @@ class Unit(pygame.sprite.Sprite):
         self.in_air = True
         self.flip = False
         self.animation_list = []
+        self.flipped_animation_list = []
         self.frame_index = 0
         self.action = 0
         self.update_time = pygame.time.get_ticks()
@@ -149,22 +336,20 @@ class Unit(pygame.sprite.Sprite):
         self.vision = pygame.Rect(0, 0, 450, 60)
         self.idling = False
         self.idling_counter = 0
-
-        # load all images for the players
-        animation_types = ["Idle", "Move", "Jump", "Death", "Attack"]
-        for animation in animation_types:
-            # reset temporary list of images
-            temp_list = []
-            # count number of files in the folder
-            num_of_frames = len(os.listdir(f"Images/{self.char_type}/{animation}/"))
-            num_of_frames -= 1
-            for i in range(num_of_frames):
-                img = pygame.image.load(f"Images/{self.char_type}/{animation}/{i}.png").convert_alpha()
-                img = pygame.transform.scale(img, (int(img.get_width() * scale), int(img.get_height() * scale)))
-                temp_list.append(img)
-            self.animation_list.append(temp_list)
+        # waypoints to the player and the frames until they are looked up again
+        self.path = None
+        self.path_age = 0
+        # frame offset of the updates when off the screen, taken from the start tile so runs repeat
+        self.tick_phase = int(x // TILE_SIZE) % NEAR_TICK
+
+        # get all images for the players from the animation cache
+        for animation in ANIMATION_TYPES:
+            frames, flipped_frames = load_animation(self.char_type, animation, scale)
+            self.animation_list.append(frames)
+            self.flipped_animation_list.append(flipped_frames)
 
         self.image = self.animation_list[self.action][self.frame_index]
+        self.flipped_image = self.flipped_animation_list[self.action][self.frame_index]
         self.rect = self.image.get_rect()
         self.rect.center = (x, y)
         self.width = self.image.get_width()
@@ -179,7 +364,6 @@ class Unit(pygame.sprite.Sprite):
 
     def move(self, moving_left, moving_right):
         # reset movement variables
-        screen_scroll = 0
         dx = 0
         dy = 0
 
@@ -205,8 +389,11 @@ class Unit(pygame.sprite.Sprite):
             self.vel_y
         dy += self.vel_y
 
-        # check for collision
-        for tile in world.obstacle_list:
+        # check for collision with the tiles around the area covered by this move,
+        # going up or down is decided once so a second ceiling tile is not taken for ground
+        rising = self.vel_y < 0
+        for tile in world.get_obstacles(self.rect.x + min(dx, 0), self.rect.y + min(dy, 0),
+                                        self.width + abs(dx), self.height + abs(dy)):
             # check collision in the x direction
             if tile[1].colliderect(self.rect.x + dx, self.rect.y, self.width, self.height):
                 dx = 0
@@ -217,11 +404,11 @@ class Unit(pygame.sprite.Sprite):
             # check collision in the y direction
             if tile[1].colliderect(self.rect.x, self.rect.y + dy, self.width, self.height):
                 # check if below the ground, jumping
-                if self.vel_y < 0:
+                if rising:
                     self.vel_y = 0
                     dy = tile[1].bottom - self.rect.top
                 # check if above the ground, falling
-                elif self.vel_y >= 0:
+                else:
                     self.vel_y = 0
                     self.in_air = False
                     dy = tile[1].top - self.rect.bottom
@@ -237,32 +424,32 @@ class Unit(pygame.sprite.Sprite):
 
         # check if going off the edges of the screen
         if self.char_type == "Dale":
-            if self.rect.left + dx < 0 or self.rect.right + dx > screen_width:
+            if self.rect.left + dx < camera.x or self.rect.right + dx > camera.x + screen_width:
                 dx = 0
 
         # update rectangle position
         self.rect.x += dx
         self.rect.y += dy
 
-        # update scroll based on player position
+        # move the camera based on player position
         if self.char_type == "Dale":
-            if (self.rect.right > screen_width - SCROLL_THRESH and
-            bg_scroll < (world.level_length * TILE_SIZE) - screen_width) or (self.rect.left < SCROLL_THRESH and
-            bg_scroll > abs(dx)):
-                self.rect.x -= dx
-                screen_scroll = -dx
+            screen_rect = camera.apply(self.rect)
+            if (screen_rect.right > screen_width - SCROLL_THRESH and
+            camera.x < (world.level_length * TILE_SIZE) - screen_width) or (screen_rect.left < SCROLL_THRESH and
+            camera.x > abs(dx)):
+                camera.x += dx
 
-        return screen_scroll, level_complete
+        return level_complete
 
     def shoot(self):
         if self.shoot_cooldown == 0 and self.ammo > 0:
             self.shoot_cooldown = 40
-            bullet = Bullet(self.rect.centerx + (0.6 * self.rect.size[0] * self.direction), self.rect.centery,
+            bullet = bullet_pool.get(self.rect.centerx + (0.6 * self.rect.size[0] * self.direction), self.rect.centery,
                             self.direction)
             bullet_group.add(bullet)
             # reduce ammo
             self.ammo -= 1
-            shot_fx.play()
+            sounds.play("shot", self.rect.centerx, PLAYER_SOUND if self.char_type == "Dale" else 0)
 
     def ai(self):
         if self.alive and player.alive:
@@ -270,41 +457,107 @@ class Unit(pygame.sprite.Sprite):
                 self.update_action(0)  # 0 for idle
                 self.idling = True
                 self.idling_counter = 50
-            # check if the ai is near the player
-            if self.vision.colliderect(player.rect):
+            # check if the ai is near the player and no wall is in the way
+            if self.vision.colliderect(player.rect) and world.line_of_sight(self.rect.center, player.rect.center):
                 # stop running
                 self.update_action(0)  # 0 for idle
                 # shoot
                 self.update_action(4)   # 4 for attack
                 self.shoot()
+                # an enemy that stops in the air keeps falling
+                if self.airborne():
+                    self.move(False, False)
             else:
                 if self.idling == False:
-                    if self.direction == 1:
-                        ai_moving_right = True
-                    else:
-                        ai_moving_right = False
-                    ai_moving_left = not ai_moving_right
-                    self.move(ai_moving_left, ai_moving_right)
-                    self.update_action(1)  # 1 for move
-                    self.move_counter += 1
-                    # update ai vision as enemy moves
-                    self.vision.center = (self.rect.centerx + 225 * self.direction, self.rect.centery)
-                    pygame.draw.rect(screen, RED, self.vision)
-                    if self.move_counter > TILE_SIZE:
-                        self.direction *= -1
-                        self.move_counter *= -1
+                    # go after the player when it is close and can be reached, otherwise patrol
+                    if not self.chase():
+                        if self.direction == 1:
+                            ai_moving_right = True
+                        else:
+                            ai_moving_right = False
+                        ai_moving_left = not ai_moving_right
+                        self.move(ai_moving_left, ai_moving_right)
+                        self.update_action(1)  # 1 for move
+                        self.move_counter += 1
+                        # update ai vision as enemy moves
+                        self.vision.center = (self.rect.centerx + 225 * self.direction, self.rect.centery)
+                        if draw_frames:
+                            pygame.draw.rect(screen, RED, camera.apply(self.vision))
+                        if self.move_counter > TILE_SIZE:
+                            self.direction *= -1
+                            self.move_counter *= -1
                 else:
                     self.idling_counter -= 1
                     if self.idling_counter <= 0:
                         self.idling = False
-
-        # scroll
-        self.rect.x += screen_scroll
+                    if self.airborne():
+                        self.move(False, False)
+
+    def chase(self):
+        # walk, fall and jump along the navigation graph towards the player,
+        # returns False when the player is too far away or cannot be reached
+        if abs(player.rect.centerx - self.rect.centerx) > CHASE_DISTANCE:
+            self.path = None
+            return False
+        col = self.rect.centerx // TILE_SIZE
+        row = self.nav_row()
+        falling = self.airborne()
+        if not falling:
+            # the player keeps moving, so the path is looked up again now and then
+            self.path_age -= 1
+            if self.path_age <= 0:
+                self.path = world.nav.find_path(self.nav_cell(), player.nav_cell(), CHASE_COST)
+                self.path_age = REPATH_FRAMES
+            # drop the waypoints reached
+            while self.path and navigation.reached(self.path[0], self.rect.left // TILE_SIZE,
+                                                   (self.rect.right - 1) // TILE_SIZE, row):
+                self.path.pop(0)
+        if not self.path:
+            return False
+        target_col, target_row, link, step = self.path[0]
+        if link == navigation.WALK:
+            moving_right = target_col > col
+            moving_left = target_col < col
+        elif falling:
+            # drop straight down from a fall, keep going across on a jump
+            moving_right = link == navigation.JUMP and step == 1 and col != target_col
+            moving_left = link == navigation.JUMP and step == -1 and col != target_col
+        else:
+            # the unit is wider than a tile, it keeps going until it is off the edge
+            moving_right = step == 1
+            moving_left = step == -1
+            if link == navigation.JUMP:
+                self.jump = True
+        self.move(moving_left, moving_right)
+        if self.airborne():
+            self.update_action(2)  # 2 for jump
+        else:
+            self.update_action(1)  # 1 for move
+        # update ai vision as enemy moves
+        self.vision.center = (self.rect.centerx + 225 * self.direction, self.rect.centery)
+        if draw_frames:
+            pygame.draw.rect(screen, RED, camera.apply(self.vision))
+        return True
+
+    def airborne(self):
+        # in_air is only set by jumps, a unit walking off an edge is falling too,
+        # one step of gravity is left in vel_y while standing on the ground
+        return self.in_air or self.vel_y > GRAVITY
+
+    def nav_cell(self):
+        # the cell the unit stands on, a unit wider than a tile can stand on a ledge with its middle over a gap
+        row = self.nav_row()
+        return world.nav.standing_col(self.rect.left // TILE_SIZE, (self.rect.right - 1) // TILE_SIZE, row), row
+
+    def nav_row(self):
+        # the row above the tile edge nearest the feet, a unit on the ground sinks into it a pixel every other frame
+        return (self.rect.bottom - TILE_SIZE // 2) // TILE_SIZE
 
     def update_animation(self):
         ANIMATION_COOLDOWN = 100
         # update image depending on current frame
         self.image = self.animation_list[self.action][self.frame_index]
+        self.flipped_image = self.flipped_animation_list[self.action][self.frame_index]
         # check if enough time has passed since last update
         if pygame.time.get_ticks() - self.update_time > ANIMATION_COOLDOWN:
             self.update_time = pygame.time.get_ticks()
@@ -333,53 +586,192 @@ class Unit(pygame.sprite.Sprite):
             self.kill()
 
     def draw(self):
-        screen.blit(pygame.transform.flip(self.image, self.flip, False), self.rect)
+        # use the mirrored frame made at load time when facing left
+        if self.flip:
+            screen.blit(self.flipped_image, camera.apply(self.rect))
+        else:
+            screen.blit(self.image, camera.apply(self.rect))
+
+
+class LevelChunk():
+    def __init__(self, index):
+        self.index = index
+        self.surface = None
+        self.obstacle_grid = []
+        # (group, sprite) for the sprites made in this chunk or parked in it
+        self.sprites = []
 
 
 class World():
     def __init__(self):
-        self.obstacle_list = []
+        self.tiles = None
+        self.chunks = {}
+        # chunks whose sprites have been made, they are only made from the level data the first time
+        self.spawned = set()
+        # (group, sprite) of the sprites taken out of play by the chunk they were in when it was dropped
+        self.parked = {}
+        # sprites only join the game groups after activate() so the world can be built on another thread
+        self.active = False
+
+    def process_data(self, data, level):
+        # the level data is a rows x cols tile array, only the chunks near the camera are built
+        self.rows, self.level_length = data.shape
+        self.tiles = data.cast("b")
+        # the platforms and the ways between them for enemies chasing the player, cached next to the level
+        self.nav = navigation.load_graph(args.level_dir, level, data, self.rows, self.level_length)
+        # the obstacle tiles counted for the batched enemy ai
+        self.solid_table = enemy_ai.solid_table(data, 0, 17) if enemy_ai else None
+        self.chunk_count = (self.level_length + tilemap.CHUNK_COLS - 1) // tilemap.CHUNK_COLS
+        # create the player at its start tile
+        start = data.tobytes().find(bytes([21]))
+        if start < 0:
+            raise ValueError(f"level {level} has no start tile")
+        x = start % self.level_length
+        y = start // self.level_length
+        player = Unit("Dale", x * TILE_SIZE, y * TILE_SIZE, 3, 5, 20, 20)
+        health_bar = HealthBar(10, 10, player.health, player.health)
+        self.stream(0)
+        return player, health_bar
 
-    def process_data(self, data):
-        self.level_length = len(data[0])
-        # iterate through each value in level data file
+    def activate(self):
+        # put the sprites of the loaded chunks into the game groups
+        self.active = True
+        for chunk in self.chunks.values():
+            for group, sprite in chunk.sprites:
+                group.add(sprite)
+
+    def stream(self, scroll):
+        # load the chunks around the view and drop the ones far away from it
+        chunk_width = tilemap.CHUNK_COLS * TILE_SIZE
+        first = int(scroll // chunk_width)
+        last = int((scroll + screen_width - 1) // chunk_width)
+        for index in range(max(first - LOAD_CHUNKS, 0), min(last + LOAD_CHUNKS, self.chunk_count - 1) + 1):
+            if index not in self.chunks:
+                self.load_chunk(index)
+        dropped = False
+        for index in list(self.chunks):
+            if index < first - EVICT_CHUNKS or index > last + EVICT_CHUNKS:
+                chunk = self.chunks.pop(index)
+                dropped = True
+                if not self.active:
+                    # nothing has moved yet, the sprites are parked where they were made
+                    self.parked.setdefault(index, []).extend(chunk.sprites)
+        if dropped and self.active:
+            self.park_sprites()
+
+    def get_tile(self, tile, x, y):
+        img = img_list[tile]
+        img_rect = img.get_rect()
+        img_rect.x = x * TILE_SIZE
+        img_rect.y = y * TILE_SIZE
+        return (img, img_rect)
+
+    def load_chunk(self, index):
+        chunk = LevelChunk(index)
+        spawn = index not in self.spawned
+        self.spawned.add(index)
+        first_col = index * tilemap.CHUNK_COLS
+        cols = min(tilemap.CHUNK_COLS, self.level_length - first_col)
+        data = []
+        for y in range(self.rows):
+            start = y * self.level_length + first_col
+            data.append(self.tiles[start:start + cols].tolist())
+        # index the obstacles by tile cell so collision only looks at nearby tiles
+        chunk.obstacle_grid = [[None] * cols for row in data]
+        # iterate through each value in the chunk
         for y, row in enumerate(data):
-            for x, tile in enumerate(row):
-                if tile >= 0:
-                    img = img_list[tile]
-                    img_rect = img.get_rect()
-                    img_rect.x = x * TILE_SIZE
-                    img_rect.y = y * TILE_SIZE
-                    tile_data = (img, img_rect)
+            for i, tile in enumerate(row):
+                x = first_col + i
+                if tile < 0:
+                    continue
+                img = img_list[tile]
+                sprite = None
+                if 0 <= tile <= 17:
+                    chunk.obstacle_grid[y][i] = self.get_tile(tile, x, y)
+                elif not spawn:
+                    # the sprites of a chunk loaded before are parked or gone
+                    continue
+                elif 18 <= tile <= 20:  # decoration
+                    sprite = Decoration(img, x * TILE_SIZE, y * TILE_SIZE)
+                    group = decoration_group
+                elif tile == 22:  # create enemies
+                    sprite = Unit("Enemy", x * TILE_SIZE, y * TILE_SIZE, 3, 3, 20, 0)
+                    group = enemy_group
+                elif tile == 23:  # create ammo box
+                    sprite = ItemBox("Ammo", x * TILE_SIZE, y * TILE_SIZE)
+                    group = item_box_group
+                elif tile == 24:  # create grenades box
+                    sprite = ItemBox("Grenade", x * TILE_SIZE, y * TILE_SIZE)
+                    group = item_box_group
+                elif tile == 25:  # create health box
+                    sprite = ItemBox("Health", x * TILE_SIZE, y * TILE_SIZE)
+                    group = item_box_group
+                elif tile == 26:  # create exit
+                    sprite = Exit(img, x * TILE_SIZE, y * TILE_SIZE)
+                    group = exit_group
+                if sprite is not None:
+                    chunk.sprites.append((group, sprite))
+                    if self.active:
+                        group.add(sprite)
+        # the sprites parked here come back as they were left
+        for group, sprite in self.parked.pop(index, []):
+            chunk.sprites.append((group, sprite))
+            if self.active:
+                group.add(sprite)
+        # bake the obstacle tiles into one surface so drawing the chunk is a single blit
+        chunk.surface = tilemap.bake_chunk(data, 0, img_list, TILE_SIZE, lambda tile: tile <= 17)
+        self.chunks[index] = chunk
+
+    def park_sprites(self):
+        # sprites in play over chunks that are not loaded leave the game groups until their chunk comes back,
+        # they keep their state so enemies come back where they were and with the health they had
+        chunk_width = tilemap.CHUNK_COLS * TILE_SIZE
+        for group in (decoration_group, enemy_group, item_box_group, exit_group):
+            for sprite in group.sprites():
+                index = min(max(sprite.rect.centerx // chunk_width, 0), self.chunk_count - 1)
+                if index not in self.chunks:
+                    group.remove(sprite)
+                    self.parked.setdefault(index, []).append((group, sprite))
+
+    def is_obstacle(self, col, row):
+        # everything outside the level is open
+        if 0 <= col < self.level_length and 0 <= row < self.rows:
+            return 0 <= self.tiles[row * self.level_length + col] <= 17
+        return False
+
+    def raycast(self, x0, y0, x1, y1):
+        # the first obstacle tile on the line as (col, row), or None
+        return collision.raycast(self.is_obstacle, TILE_SIZE, x0, y0, x1, y1)
+
+    def line_of_sight(self, start, end):
+        return self.raycast(*start, *end) is None
+
+    def get_obstacles(self, x, y, width, height):
+        first_col = max(int(x // TILE_SIZE), 0)
+        last_col = min(int((x + width) // TILE_SIZE), self.level_length - 1)
+        first_row = max(int(y // TILE_SIZE), 0)
+        last_row = min(int((y + height) // TILE_SIZE), self.rows - 1)
+        obstacles = []
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                chunk = self.chunks.get(col // tilemap.CHUNK_COLS)
+                if chunk is not None:
+                    tile_data = chunk.obstacle_grid[row][col - chunk.index * tilemap.CHUNK_COLS]
+                    if tile_data is not None:
+                        obstacles.append(tile_data)
+                else:
+                    # chunks that are not loaded are read straight from the level data
+                    tile = self.tiles[row * self.level_length + col]
                     if 0 <= tile <= 17:
-                        self.obstacle_list.append(tile_data)
-                    elif 18 <= tile <= 20:  # decoration
-                        decoration = Decoration(img, x * TILE_SIZE, y * TILE_SIZE)
-                        decoration_group.add(decoration)
-                    elif tile == 21:  # create a player
-                        player = Unit("Dale", x * TILE_SIZE, y * TILE_SIZE, 3, 5, 20, 20)
-                        health_bar = HealthBar(10, 10, player.health, player.health)
-                    elif tile == 22:  # create enemies
-                        enemy = Unit("Enemy", x * TILE_SIZE, y * TILE_SIZE, 3, 3, 20, 0)
-                        enemy_group.add(enemy)
-                    elif tile == 23:  # create ammo box
-                        item_box = ItemBox("Ammo", x * TILE_SIZE, y * TILE_SIZE)
-                        item_box_group.add(item_box)
-                    elif tile == 24:  # create grenades box
-                        item_box = ItemBox("Grenade", x * TILE_SIZE, y * TILE_SIZE)
-                        item_box_group.add(item_box)
-                    elif tile == 25:  # create health box
-                        item_box = ItemBox("Health", x * TILE_SIZE, y * TILE_SIZE)
-                        item_box_group.add(item_box)
-                    elif tile == 26:  # create exit
-                        exit = Exit(img, x * TILE_SIZE, y * TILE_SIZE)
-                        exit_group.add(exit)
-        return player, health_bar
+                        obstacles.append(self.get_tile(tile, col, row))
+        return obstacles
 
     def draw(self):
-        for tile in self.obstacle_list:
-            tile[1][0] += screen_scroll
-            screen.blit(tile[0], tile[1])
+        # only blit the chunks that are on the screen
+        chunk_width = tilemap.CHUNK_COLS * TILE_SIZE
+        for i in tilemap.visible_chunks(camera.x, screen_width, self.chunk_count, TILE_SIZE):
+            if i in self.chunks:
+                screen.blit(self.chunks[i].surface, (i * chunk_width - camera.x, 0))
 
 
 class Decoration(pygame.sprite.Sprite):
@@ -389,9 +781,6 @@ class Decoration(pygame.sprite.Sprite):
         self.rect = self.image.get_rect()
         self.rect.midtop = (x + TILE_SIZE // 2, y + (TILE_SIZE - self.image.get_height()))
 
-    def update(self):
-        self.rect.x += screen_scroll
-
 
 class Exit(pygame.sprite.Sprite):
     def __init__(self, img, x, y):
@@ -400,9 +789,6 @@ class Exit(pygame.sprite.Sprite):
         self.rect = self.image.get_rect()
         self.rect.midtop = (x + TILE_SIZE // 2, y + (TILE_SIZE - self.image.get_height()))
 
-    def update(self):
-        self.rect.x += screen_scroll
-
 
 class ItemBox(pygame.sprite.Sprite):
     def __init__(self, item_type, x, y):
@@ -413,8 +799,6 @@ class ItemBox(pygame.sprite.Sprite):
         self.rect.midtop = (x + TILE_SIZE // 2, y + (TILE_SIZE - self.image.get_height()))
 
     def update(self):
-        # scroll
-        self.rect.x += screen_scroll
         # check if the player has picked up the box
         if pygame.sprite.collide_rect(self, player):
             # check type of box
@@ -437,61 +821,80 @@ class HealthBar():
         self.health = health
         self.max_health = max_health
 
-    def draw(self, health):
+    def draw(self, health, surface):
         # update with new health
         self.health = health
         # calculate health ratio
         ratio = self.health / self.max_health
-        pygame.draw.rect(screen, BLACK, (self.x - 2, self.y - 2, 154, 24))
-        pygame.draw.rect(screen, RED, (self.x, self.y, 150, 20))
-        pygame.draw.rect(screen, GREEN, (self.x, self.y, 150 * ratio, 20))
-
-
-class Bullet(pygame.sprite.Sprite):
+        pygame.draw.rect(surface, BLACK, (self.x - 2, self.y - 2, 154, 24))
+        pygame.draw.rect(surface, RED, (self.x, self.y, 150, 20))
+        pygame.draw.rect(surface, GREEN, (self.x, self.y, 150 * ratio, 20))
+
+
+class Hud():
+    def __init__(self, width, height):
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.shown = None
+
+    def draw(self, health_bar, player):
+        # the hud is drawn into its own surface only when what it shows changes, then blitted in one go
+        shown = (player.health, player.max_health, player.ammo, player.grenades)
+        if shown != self.shown:
+            self.shown = shown
+            self.surface.fill((0, 0, 0, 0))
+            # show player health
+            health_bar.draw(player.health, self.surface)
+            # show ammo
+            draw_text("AMMO: ", font, WHITE, 10, 35, self.surface)
+            for x in range(player.ammo):
+                self.surface.blit(bullet_img, (100 + (x * 15), 40))
+            # show grenades
+            for x in range(player.grenades):
+                self.surface.blit(grenade_img, (10 + (x * 25), 60))
+        screen.blit(self.surface, (0, 0))
+
+
+class Bullet(pool.PooledSprite):
     def __init__(self, x, y, direction):
-        pygame.sprite.Sprite.__init__(self)
+        pool.PooledSprite.__init__(self)
         self.speed = 10
         self.image = hat_img
         self.rect = self.image.get_rect()
+        self.reset(x, y, direction)
+
+    def reset(self, x, y, direction):
         self.rect.center = (x, y)
         self.direction = direction
 
     def update(self):
         # move bullet
-        self.rect.x += (self.direction * self.speed) + screen_scroll
+        start_x = self.rect.centerx
+        self.rect.x += self.direction * self.speed
         # check if bullet is out the screen
-        if self.rect.right < 0 or self.rect.left > screen_width:
+        if self.rect.right < camera.x or self.rect.left > camera.x + screen_width:
+            self.kill()
+        # check collision with level along the path from the last frame to the front of the bullet
+        front_x = self.rect.centerx + self.direction * (self.rect.width // 2)
+        if world.raycast(start_x, self.rect.centery, front_x, self.rect.centery) is not None:
             self.kill()
-        # check collision with level
-        for tile in world.obstacle_list:
-            if tile[1].colliderect(self.rect):
-                self.kill()
-
-        # check collision with characters
-        if pygame.sprite.spritecollide(player, bullet_group, False):
-            if player.alive:
-                player.health -= 5
-                self.kill()
-        for enemy in enemy_group:
-            if pygame.sprite.spritecollide(enemy, bullet_group, False):
-                if enemy.alive:
-                    enemy.health -= 25
-                    self.kill()
 
 
-class Grenade(pygame.sprite.Sprite):
+class Grenade(pool.PooledSprite):
     def __init__(self, x, y, direction):
-        pygame.sprite.Sprite.__init__(self)
-        self.timer = 100
-        self.vel_y = -15
-        self.speed = 7
+        pool.PooledSprite.__init__(self)
         self.image = grenade_img
         self.rect = self.image.get_rect()
-        self.rect.center = (x, y)
         self.width = self.image.get_width()
         self.height = self.image.get_height()
+        self.reset(x, y, direction)
+
+    def reset(self, x, y, direction):
+        self.timer = 100
+        self.vel_y = -15
+        self.speed = 7
+        self.rect.center = (x, y)
         self.direction = direction
-        grenade_fx.play()
+        sounds.play("grenade", x, PLAYER_SOUND)
 
     def update(self):
         self.vel_y += GRAVITY
@@ -500,7 +903,9 @@ class Grenade(pygame.sprite.Sprite):
 
 
         # check collision with level
-        for tile in world.obstacle_list:
+        # the grenade can bounce back, so look at the tiles on both sides
+        for tile in world.get_obstacles(self.rect.x - self.speed, self.rect.y + min(dy, 0),
+                                        self.width + 2 * self.speed, self.height + abs(dy)):
             # check collision with walls
             if tile[1].colliderect(self.rect.x + dx, self.rect.y, self.width, self.height):
                 self.direction *= -1
@@ -518,30 +923,19 @@ class Grenade(pygame.sprite.Sprite):
                         dy = tile[1].top - self.rect.bottom
 
         # check if grenade is out the screen
-        if self.rect.right + dx < 0 or self.rect.left + dx > screen_width:
+        if self.rect.right + dx < camera.x or self.rect.left + dx > camera.x + screen_width:
             self.direction *= -1
             dx = self.direction * self.speed
 
         # update grenade position
-        self.rect.x += dx + screen_scroll
+        self.rect.x += dx
         self.rect.y += dy
 
-        # check collision with characters
-        if pygame.sprite.spritecollide(player, grenade_group, False):
-            if player.alive:
-                player.health -= 5
-                self.kill()
-        for enemy in enemy_group:
-            if pygame.sprite.spritecollide(enemy, grenade_group, False):
-                if enemy.alive:
-                    enemy.health -= 50
-                    self.kill()
-
         # countdown timer
         self.timer -= 1
         if self.timer <= 0:
             self.kill()
-        #     explosion = Explosion(self.rect.x, self.rect.y, 0.5)
+        #     explosion = explosion_pool.get(self.rect.x, self.rect.y, 0.5)
         #     explosion_group.add(explosion)
         #     # do damage to anyone who nearby
         #     if abs(self.rect.centerx - player.rect.centerx) < TILE_SIZE * 2 and abs(
@@ -553,24 +947,22 @@ class Grenade(pygame.sprite.Sprite):
         #             enemy.health -= 50
 
 
-class Explosion(pygame.sprite.Sprite):
+class Explosion(pool.PooledSprite):
     def __init__(self, x, y, scale):
-        pygame.sprite.Sprite.__init__(self)
-        self.images = []
-        for num in range(1, 5):
-            img = pygame.image.load(f"Images/Explosion/exp{num}.png").convert_alpha()
-            img = pygame.transform.scale(img, (int(img.get_width() * scale), int(img.get_height() * scale)))
-            self.images.append(img)
+        pool.PooledSprite.__init__(self)
+        self.image = grenade_img
+        self.rect = self.image.get_rect()
+        self.reset(x, y, scale)
+
+    def reset(self, x, y, scale):
+        self.images = load_explosion(scale)
         self.frame_index = 0
         self.image = self.images[self.frame_index]
         self.image = grenade_img
-        self.rect = self.image.get_rect()
         self.rect.center = (x, y)
         self.counter = 0
 
     def update(self):
-        # scroll
-        self.rect.x += screen_scroll
         EXPLOSION_SPEED = 4
         # update explosion animation
         self.counter += 1
@@ -595,12 +987,12 @@ class ScreenFade():
     def fade(self):
         fade_complete = False
         self.fade_counter += self.speed
-        if self.direction == 1:     # whole screen fade
+        if self.direction == 1 and draw_frames:     # whole screen fade
             pygame.draw.rect(screen, self.colour, (0 - self.fade_counter, 0, screen_width // 2, screen_height))
             pygame.draw.rect(screen, self.colour, (screen_width // 2 + self.fade_counter, 0, screen_width, screen_height))
             pygame.draw.rect(screen, self.colour, (0, 0 - self.fade_counter, screen_width, screen_height // 2))
             pygame.draw.rect(screen, self.colour, (0, screen_height // 2 + self.fade_counter, screen_width, screen_height))
-        if self.direction == 2:     # vertical screen fade down
+        if self.direction == 2 and draw_frames:     # vertical screen fade down
             pygame.draw.rect(screen, self.colour, (0, 0, screen_width, 0 + self.fade_counter))
         if self.fade_counter >= screen_width:
             fade_complete = True
@@ -608,6 +1000,61 @@ class ScreenFade():
         return  fade_complete
 
 
+class LevelPreloader():
+    def __init__(self):
+        self.level = None
+        self.thread = None
+        self.result = None
+
+    def start(self, level):
+        # build a level on a worker thread while the current one is being played
+        self.level = level
+        self.result = None
+        self.thread = None
+        if level <= MAX_LEVELS and levels.level_exists(args.level_dir, level):
+            self.thread = threading.Thread(target=self.load, args=(level,), daemon=True)
+            self.thread.start()
+
+    def load(self, level):
+        world = World()
+        player, health_bar = world.process_data(levels.load_level(args.level_dir, level), level)
+        self.result = (world, player, health_bar)
+
+    def take(self, level):
+        # wait for the prepared level, or build it now if a different one was prepared
+        if self.level == level and self.thread is not None:
+            self.thread.join()
+            self.level = None
+            if self.result is not None:
+                return self.result
+        world = World()
+        player, health_bar = world.process_data(levels.load_level(args.level_dir, level), level)
+        return world, player, health_bar
+
+
+class Camera():
+    def __init__(self, width, height):
+        self.x = 0
+        self.width = width
+        self.height = height
+
+    def apply(self, rect):
+        # convert a world rect to its position on the screen
+        return rect.move(-self.x, 0)
+
+    def get_view(self):
+        return pygame.Rect(self.x, 0, self.width, self.height)
+
+
+# create camera
+camera = Camera(screen_width, screen_height)
+
+# create the hud
+hud = Hud(screen_width, 100)
+
+# only the changed parts of still screens are sent to the display
+updates = screen_updates.ScreenUpdates(screen)
+
 # create screen fade
 intro_fade = ScreenFade(1, BLACK, 4)
 death_fade = ScreenFade(2, GRAY, 4)
@@ -618,78 +1065,131 @@ exit_button = button.Button(screen_width // 2 - 160, screen_height // 2 + 50, ex
 restart_button = button.Button(screen_width // 2 - 250, screen_height // 2 - 50, restart_img, 1)
 
 # create sprite groups
-enemy_group = pygame.sprite.Group()
+if enemy_ai:
+    enemy_group = enemy_ai.EnemyGroup(TILE_SIZE, GRAVITY, screen_height, ACTIVE_MARGIN, NEAR_DISTANCE, NEAR_TICK,
+                                      CHASE_DISTANCE, random.getrandbits(32))
+else:
+    enemy_group = pygame.sprite.Group()
 bullet_group = pygame.sprite.Group()
 grenade_group = pygame.sprite.Group()
 explosion_group = pygame.sprite.Group()
 item_box_group = pygame.sprite.Group()
 decoration_group = pygame.sprite.Group()
 exit_group = pygame.sprite.Group()
+# projectiles and explosions are reused once they are killed
+bullet_pool = pool.SpritePool(Bullet)
+grenade_pool = pool.SpritePool(Grenade)
+explosion_pool = pool.SpritePool(Explosion)
+# spatial hash of the characters for projectile collisions
+unit_hash = collision.SpatialHash(TILE_SIZE * 2)
 
-# create empty tile list
-world_data = []
-for row in range(ROWS):
-    r = [-1] * COLS
-    world_data.append(r)
 # load in level data and create world
-with open(f"level{level}_data.csv", newline="") as csvfile:
-    reader = csv.reader(csvfile, delimiter=",")
-    for x, row in enumerate(reader):
-        for y, tile in enumerate(row):
-            world_data[x][y] = int(tile)
-world = World()
-player, health_bar = world.process_data(world_data)
-
+preloader = LevelPreloader()
+world, player, health_bar = load_world(level)
+
+# time the phases of each frame when asked to, a json dump keeps every frame
+show_profiler = args.profile
+timer = profiler.FrameTimer(enabled=show_profiler or bool(args.profile_out),
+                            history=None if args.profile_out else 120)
+
+# scripted input
+input_script = {}
+if args.input:
+    input_script = load_input_script(args.input)
+
+frame = 0
+awake_enemies = []
+start_time = time.perf_counter()
 run = True
 while run:
 
-    clock.tick(FPS)
+    # headless runs go as fast as the cpu allows
+    if headless:
+        clock.tick()
+    else:
+        clock.tick(FPS)
+    frame += 1
+    for event in input_script.get(frame, []):
+        pygame.event.post(event)
+    if frame == args.frames:
+        run = False
+    timer.start_frame()
 
     if not start_game:
-        # draw menu
-        screen.fill(BG)
+        # draw menu, it does not change so it is only drawn when it first shows
+        if not updates.is_still("menu"):
+            screen.fill(BG)
         # add buttons
         if start_button.draw(screen):
             start_game = True
             start_intro = True
         if exit_button.draw(screen):
             run = False
+        updates.keep_still("menu")
+        timer.lap("menu")
     else:
-        draw_bg()
-        # draw map
-        world.draw()
-        # show player health
-        health_bar.draw(player.health)
-        # show ammo
-        # draw_text("AMMO: ", font, WHITE, 10, 35)
-        # for x in range(player.ammo):
-        #     screen.blit(bullet_img, (100 + (x * 15), 40))
-        # show grenades
-        # draw_text("GRENADES: ", font, WHITE, 10, 60)
-        for x in range(player.grenades):
-            screen.blit(grenade_img, (10 + (x * 25), 60))
-        # show ammo
+        # once the death screen has faded in only the game logic runs under it
+        draw_scene = draw_frames and not updates.is_still("death")
+        if draw_scene:
+            updates.moving()
+        # load the level around the camera
+        world.stream(camera.x)
+        timer.lap("world stream")
+        if draw_scene:
+            draw_bg()
+        timer.lap("background")
+        if draw_scene:
+            # draw map
+            world.draw()
+        timer.lap("world draw")
+        if draw_scene:
+            # show player health, ammo and grenades
+            hud.draw(health_bar, player)
+        timer.lap("hud")
 
         player.update()
-        player.draw()
-        for enemy in enemy_group:
-            enemy.ai()
-            enemy.draw()
+        if draw_scene:
+            player.draw()
+        timer.lap("player update")
+        # only the enemies near the camera are updated
+        if enemy_ai:
+            awake_enemies = enemy_group.ai(player, world, camera.get_view(), frame)
+            if draw_scene:
+                enemy_group.draw_vision(screen, RED, camera)
+        else:
+            awake_enemies = [enemy for enemy in enemy_group if enemy_awake(enemy, camera.get_view(), frame)]
+            for enemy in awake_enemies:
+                enemy.ai()
+        for enemy in awake_enemies:
+            if draw_scene:
+                enemy.draw()
             enemy.update()
+        timer.lap("enemy ai")
 
         # update and draw groups
         bullet_group.update()
+        timer.lap("bullet update")
         grenade_group.update()
+        timer.lap("grenade update")
+        check_projectile_hits()
+        timer.lap("projectile hits")
         explosion_group.update()
+        timer.lap("explosion update")
         item_box_group.update()
-        decoration_group.update()
-        exit_group.update()
-        bullet_group.draw(screen)
-        grenade_group.draw(screen)
-        explosion_group.draw(screen)
-        item_box_group.draw(screen)
-        decoration_group.draw(screen)
-        exit_group.draw(screen)
+        timer.lap("item box update")
+        if draw_scene:
+            draw_group(bullet_group)
+            timer.lap("bullet draw")
+            draw_group(grenade_group)
+            timer.lap("grenade draw")
+            draw_group(explosion_group)
+            timer.lap("explosion draw")
+            draw_group(item_box_group)
+            timer.lap("item box draw")
+            draw_group(decoration_group)
+            timer.lap("decoration draw")
+            draw_group(exit_group)
+            timer.lap("exit draw")
 
         # show intro
         if start_intro:
@@ -704,7 +1204,7 @@ while run:
                 player.shoot()
             # throw grenades
             elif grenade and grenade_thrown == False and player.grenades > 0:
-                grenade = Grenade(player.rect.centerx + (0.5 * player.rect.size[0] * player.direction),
+                grenade = grenade_pool.get(player.rect.centerx + (0.5 * player.rect.size[0] * player.direction),
                                   player.rect.top, player.direction)
                 grenade_group.add(grenade)
                 # reduce grenades
@@ -716,44 +1216,40 @@ while run:
                 player.update_action(1)  # 1 for moving
             else:
                 player.update_action(0)  # 0 for idle
-            screen_scroll, level_complete = player.move(moving_left, moving_right)
-            bg_scroll -= screen_scroll
+            level_complete = player.move(moving_left, moving_right)
             # check if player complete the level
             if level_complete:
                 start_intro = True
                 level += 1
-                bg_scroll = 0
-                world_data = reset_level()
+                camera.x = 0
                 if level <= MAX_LEVELS:
-                    # load in level data and create world
-                    with open(f"level{level}_data.csv", newline="") as csvfile:
-                        reader = csv.reader(csvfile, delimiter=",")
-                        for x, row in enumerate(reader):
-                            for y, tile in enumerate(row):
-                                world_data[x][y] = int(tile)
-                    world = World()
-                    player, health_bar = world.process_data(world_data)
+                    # swap in the level prepared in the background
+                    world, player, health_bar = load_world(level)
+                else:
+                    reset_level()
+                    # nothing left to simulate after the last level
+                    if headless:
+                        run = False
         else:
-            screen_scroll = 0
             if death_fade.fade():
-                if restart_button.draw(screen):
+                updates.keep_still("death")
+                # headless runs restart on their own
+                if headless or restart_button.draw(screen):
+                    updates.moving()
                     death_fade.fade_counter = 0
                     start_intro = True
-                    bg_scroll = 0
-                    world_data = reset_level()
+                    camera.x = 0
                     # load in level data and create world
-                    with open(f"level{level}_data.csv", newline="") as csvfile:
-                        reader = csv.reader(csvfile, delimiter=",")
-                        for x, row in enumerate(reader):
-                            for y, tile in enumerate(row):
-                                world_data[x][y] = int(tile)
-                    world = World()
-                    player, health_bar = world.process_data(world_data)
+                    world, player, health_bar = load_world(level)
+        timer.lap("player move")
 
     for event in pygame.event.get():
         # Exit
         if event.type == pygame.QUIT:
             run = False
+        # a still screen is only sent once, so it is sent again when the window shows again
+        if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED):
+            updates.exposed()
 
         # Keyboard pushdowns
         if event.type == pygame.KEYDOWN:
@@ -767,9 +1263,12 @@ while run:
                 grenade = True
             if event.key == pygame.K_w and player.alive:
                 player.jump = True
-                jump_fx.play()
+                sounds.play("jump", priority=PLAYER_SOUND)
             if event.key == pygame.K_ESCAPE:
                 run = False
+            if event.key == pygame.K_F3:
+                show_profiler = not show_profiler
+                timer.set_enabled(show_profiler or bool(args.profile_out))
 
         # Keyboard pushups
         if event.type == pygame.KEYUP:
@@ -782,7 +1281,26 @@ while run:
             if event.key == pygame.K_q:
                 grenade = False
                 grenade_thrown = False
-
-    pygame.display.update()
+    timer.lap("events")
+
+    # show the rolling average of each phase
+    updates.clear_overlay()
+    if show_profiler and draw_frames:
+        updates.add_overlay(timer.draw(screen, profiler_font, WHITE, screen_width - 230, 10))
+        timer.lap("profiler")
+
+    if not headless:
+        updates.present()
+    timer.lap("display")
+    timer.end_frame()
+
+# report how fast the simulation ran, for headless and profiling runs
+if headless or timer.enabled:
+    elapsed = time.perf_counter() - start_time
+    print(f"{frame} frames in {elapsed:.2f}s ({frame / elapsed:.1f} fps)")
+if timer.enabled:
+    print(timer.summary())
+if args.profile_out:
+    timer.save(args.profile_out)
 
 pygame.quit()
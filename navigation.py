@@ -0,0 +1,308 @@
+import bisect
+import heapq
+import os
+import struct
+import sys
+import zlib
+from array import array
+import levels
+
+# how a waypoint is reached from the one before it
+WALK = 0
+FALL = 1
+JUMP = 2
+
+# sized for the enemies, they are three tiles tall and jump about three tiles up and two across
+CLEARANCE = 3
+JUMP_COLS = 2
+JUMP_ROWS = 3
+# the obstacle tiles units stand on
+SOLID_FIRST = 0
+SOLID_LAST = 17
+
+# graph files hold a header and then the segments and links as arrays of ints
+NAV_MAGIC = b"PNAV"
+NAV_VERSION = 1
+# magic, version, crc of the level tiles, rows, cols, clearance, jump cols, jump rows, segment count, link count
+HEADER = struct.Struct("<4sHIHIHHHII")
+SEGMENT_SIZE = 3  # row, first col, last col
+LINK_SIZE = 5  # from segment, from col, to segment, to col, kind
+
+
+# the platforms of a level as segments of cells a unit can stand on, and the falls and jumps between them
+class NavGraph():
+    def __init__(self, rows, cols, segments, links):
+        self.rows = rows
+        self.cols = cols
+        self.segments = segments
+        self.link_data = links
+        self.row_starts, self.row_segments = row_index(rows, segments)
+        # the links leaving each segment as (from col, to segment, to col, cost, kind)
+        self.links = [[] for i in range(len(segments) // SEGMENT_SIZE)]
+        for i in range(0, len(links), LINK_SIZE):
+            segment, from_col, to_segment, to_col, kind = links[i:i + LINK_SIZE]
+            rise = abs(segments[segment * SEGMENT_SIZE] - segments[to_segment * SEGMENT_SIZE])
+            cost = abs(to_col - from_col) + rise + (1 if kind == JUMP else 0)
+            self.links[segment].append((from_col, to_segment, to_col, cost, kind))
+
+    def segment_at(self, col, row):
+        # the segment over this cell, -1 for none
+        if not (0 <= col < self.cols and 0 <= row < self.rows):
+            return -1
+        i = bisect.bisect_right(self.row_starts[row], col) - 1
+        if i >= 0:
+            segment = self.row_segments[row][i]
+            if col <= self.segments[segment * SEGMENT_SIZE + 2]:
+                return segment
+        return -1
+
+    def segment_under(self, col, row):
+        # the segment a unit at this cell stands on, or falls onto, -1 for none
+        if not 0 <= col < self.cols:
+            return -1
+        for below in range(max(row, 0), self.rows):
+            segment = self.segment_at(col, below)
+            if segment >= 0:
+                return segment
+        return -1
+
+    def standing_col(self, first_col, last_col, row):
+        # the column a unit covering first_col to last_col stands on, the middle one when it can
+        middle = (first_col + last_col) // 2
+        for col in [middle] + list(range(first_col, last_col + 1)):
+            if self.segment_at(col, row) >= 0:
+                return col
+        return middle
+
+    def find_path(self, start, goal, max_cost=None):
+        # a* from the start cell to the goal cell, both as (col, row)
+        # returns the (col, row, kind, step) waypoints after the start, step is 1 or -1 for the way to go,
+        # or None when there is no way within max_cost, the cost is about the number of tiles walked, fallen and jumped
+        start_segment = self.segment_under(*start)
+        goal_segment = self.segment_under(*goal)
+        if start_segment < 0 or goal_segment < 0:
+            return None
+        start_row = self.segments[start_segment * SEGMENT_SIZE]
+        goal_row = self.segments[goal_segment * SEGMENT_SIZE]
+        start_col = start[0]
+        goal_col = goal[0]
+        # a point is a segment and a column on it, the goal is its own point
+        done = (-1, goal_col)
+        best = {(start_segment, start_col): 0}
+        came_from = {}
+        queue = [(abs(start_col - goal_col) + abs(start_row - goal_row), 0, start_segment, start_col)]
+        while queue:
+            estimate, cost, segment, col = heapq.heappop(queue)
+            if segment < 0:
+                break
+            if cost > best[(segment, col)]:
+                continue
+            steps = self.links[segment]
+            if segment == goal_segment:
+                steps = steps + [(goal_col, -1, goal_col, 0, WALK)]
+            for from_col, to_segment, to_col, link_cost, kind in steps:
+                new_cost = cost + abs(col - from_col) + link_cost
+                point = (to_segment, to_col)
+                if new_cost >= best.get(point, new_cost + 1):
+                    continue
+                to_row = goal_row if to_segment < 0 else self.segments[to_segment * SEGMENT_SIZE]
+                estimate = new_cost + abs(to_col - goal_col) + abs(to_row - goal_row)
+                if max_cost is not None and estimate > max_cost:
+                    continue
+                best[point] = new_cost
+                came_from[point] = ((segment, col), from_col, kind)
+                heapq.heappush(queue, (estimate, new_cost, to_segment, to_col))
+        if done not in came_from:
+            return None
+        # walk back from the goal, every link adds its takeoff and landing
+        path = []
+        point = done
+        while point in came_from:
+            previous, from_col, kind = came_from[point]
+            if point == done:
+                path.append((goal_col, goal_row, WALK))
+            else:
+                path.append((point[1], self.segments[point[0] * SEGMENT_SIZE], kind))
+                path.append((from_col, self.segments[previous[0] * SEGMENT_SIZE], WALK))
+            point = previous
+        path.reverse()
+        waypoints = []
+        last_col, last_row = start_col, start_row
+        for col, row, kind in path:
+            if (col, row) != (last_col, last_row):
+                waypoints.append((col, row, kind, 1 if col > last_col else -1))
+                last_col, last_row = col, row
+        return waypoints
+
+
+def reached(waypoint, first_col, last_col, row):
+    # for a unit covering first_col to last_col, a walk is reached when it is over the waypoint,
+    # a fall or jump once landed on its row over or past its column
+    target_col, target_row, kind, step = waypoint
+    if kind == WALK:
+        return row == target_row and first_col <= target_col <= last_col
+    if step == 1:
+        return row == target_row and last_col >= target_col
+    return row == target_row and first_col <= target_col
+
+
+def row_index(rows, segments):
+    # the first column and number of the segments in every row, in column order,
+    # so the segment over a cell is found without a map of every cell
+    starts = [array("i") for row in range(rows)]
+    numbers = [array("i") for row in range(rows)]
+    for i in sorted(range(len(segments) // SEGMENT_SIZE),
+                    key=lambda i: (segments[i * SEGMENT_SIZE], segments[i * SEGMENT_SIZE + 1])):
+        row = segments[i * SEGMENT_SIZE]
+        starts[row].append(segments[i * SEGMENT_SIZE + 1])
+        numbers[row].append(i)
+    return starts, numbers
+
+
+def solid_cells(tiles):
+    # one byte per tile, 1 for the obstacles, the tiles are signed bytes
+    table = bytes(1 if SOLID_FIRST <= (value if value < 128 else value - 256) <= SOLID_LAST else 0
+                  for value in range(256))
+    return bytes(tiles).translate(table)
+
+
+def is_open(solid, cols, col, first_row, last_row):
+    # no obstacle in the column between the rows, rows above the level are open
+    for row in range(max(first_row, 0), last_row + 1):
+        if solid[row * cols + col]:
+            return False
+    return True
+
+
+def clear_jump(solid, cols, from_col, from_row, to_col, to_row):
+    # a rough check of the arc, the unit rises at the takeoff and crosses over at the height of the higher end
+    top = min(from_row, to_row)
+    if not is_open(solid, cols, from_col, top - CLEARANCE + 1, from_row):
+        return False
+    for col in range(min(from_col, to_col), max(from_col, to_col) + 1):
+        if not is_open(solid, cols, col, top - CLEARANCE + 1, top):
+            return False
+    return True
+
+
+def add_link(links, found, link):
+    # the same link can be found from both of its ends
+    if link not in found:
+        found.add(link)
+        links.extend(link)
+
+
+def build_graph(tiles, rows, cols):
+    # tiles is the level row by row
+    solid = solid_cells(tiles)
+
+    # a segment is a run of cells in a row with an obstacle under each and room above for the unit
+    segments = array("i")
+    for row in range(rows - 1):
+        below = (row + 1) * cols
+        first = None
+        for col in range(cols + 1):
+            standing = col < cols and solid[below + col] and is_open(solid, cols, col, row - CLEARANCE + 1, row)
+            if standing and first is None:
+                first = col
+            elif not standing and first is not None:
+                segments.extend((row, first, col - 1))
+                first = None
+    graph = NavGraph(rows, cols, segments, array("i"))
+
+    found = set()
+    links = array("i")
+    for i in range(len(segments) // SEGMENT_SIZE):
+        row, first, last = segments[i * SEGMENT_SIZE:(i + 1) * SEGMENT_SIZE]
+        for edge, step in ((first, -1), (last, 1)):
+            # step off the edge and drop straight down onto the first segment below
+            col = edge + step
+            if 0 <= col < cols and is_open(solid, cols, col, row - CLEARANCE + 1, row):
+                for drop_row in range(row + 1, rows):
+                    if solid[drop_row * cols + col]:
+                        break
+                    target = graph.segment_at(col, drop_row)
+                    if target >= 0:
+                        add_link(links, found, (i, edge, target, col, FALL))
+                        break
+            # jump from the edge to the nearest cell of the segments close by, higher or lower
+            for target_row in range(max(row - JUMP_ROWS, 0), min(row + JUMP_ROWS, rows - 1) + 1):
+                for distance in range(1, JUMP_COLS + 1):
+                    col = edge + step * distance
+                    if not 0 <= col < cols:
+                        break
+                    target = graph.segment_at(col, target_row)
+                    if target >= 0 and target != i:
+                        if clear_jump(solid, cols, edge, row, col, target_row):
+                            add_link(links, found, (i, edge, target, col, JUMP))
+                        break
+            # and up onto the edge from the segments a little lower, like a ledge over a floor
+            for source_row in range(row + 1, min(row + JUMP_ROWS, rows - 1) + 1):
+                for distance in range(1, JUMP_COLS + 1):
+                    col = edge + step * distance
+                    if not 0 <= col < cols:
+                        break
+                    source = graph.segment_at(col, source_row)
+                    if source >= 0:
+                        if clear_jump(solid, cols, col, source_row, edge, row):
+                            add_link(links, found, (source, col, i, edge, JUMP))
+                        break
+    return NavGraph(rows, cols, segments, links)
+
+
+def graph_path(level_dir, level):
+    return os.path.join(level_dir, f"level{level}_nav.bin")
+
+
+def write_graph(path, graph, crc):
+    header = HEADER.pack(NAV_MAGIC, NAV_VERSION, crc, graph.rows, graph.cols, CLEARANCE, JUMP_COLS, JUMP_ROWS,
+                         len(graph.segments) // SEGMENT_SIZE, len(graph.link_data) // LINK_SIZE)
+    levels.write_file(path, header + graph.segments.tobytes() + graph.link_data.tobytes())
+
+
+def read_graph(path, crc, rows, cols):
+    # the cached graph, or None when it was made for other tiles or other unit sizes
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as graph_file:
+        data = graph_file.read()
+    if len(data) < HEADER.size:
+        return None
+    header = HEADER.unpack_from(data)
+    if header[:8] != (NAV_MAGIC, NAV_VERSION, crc, rows, cols, CLEARANCE, JUMP_COLS, JUMP_ROWS):
+        return None
+    segments = array("i")
+    links = array("i")
+    start = HEADER.size
+    end = start + header[8] * SEGMENT_SIZE * segments.itemsize
+    segments.frombytes(data[start:end])
+    links.frombytes(data[end:end + header[9] * LINK_SIZE * links.itemsize])
+    return NavGraph(rows, cols, segments, links)
+
+
+def load_graph(level_dir, level, tiles, rows, cols):
+    # the navigation graph of a level, from its cache file next to the level when that is up to date,
+    # the tiles are only copied when the graph has to be built
+    crc = zlib.crc32(tiles)
+    path = graph_path(level_dir, level)
+    graph = read_graph(path, crc, rows, cols)
+    if graph is None:
+        graph = build_graph(bytes(tiles), rows, cols)
+        try:
+            write_graph(path, graph, crc)
+        except OSError:
+            # a read only level folder still gets a graph, it is only built every time
+            pass
+    return graph
+
+
+if __name__ == "__main__":
+    # build the graphs of the levels given by number, or of every level in this folder
+    numbers = [int(number) for number in sys.argv[1:]] or sorted(
+        int(name[5:-9]) for name in os.listdir(".")
+        if name.startswith("level") and name.endswith("_data.csv"))
+    for level in numbers:
+        data = levels.load_level(".", level)
+        graph = load_graph(".", level, data, *data.shape)
+        print(f"level {level}: {len(graph.segments) // SEGMENT_SIZE} segments, "
+              f"{len(graph.link_data) // LINK_SIZE} links -> {graph_path('.', level)}")
@@ -0,0 +1,34 @@
+import pygame
+
+
+# background made of repeated layers that scroll at different speeds
+class ParallaxBackground():
+    def __init__(self, size, colour, repeats=5):
+        self.surface = pygame.Surface(size).convert()
+        self.colour = colour
+        self.repeats = repeats
+        self.layers = []
+        self.scroll = None
+
+    def add_layer(self, image, speed, y):
+        # layers without transparent pixels can be blitted without alpha
+        if pygame.mask.from_surface(image, 254).count() == image.get_width() * image.get_height():
+            image = image.convert()
+        self.layers.append((image, speed, y))
+        self.scroll = None
+
+    def draw(self, surface, scroll):
+        # only put the layers together again when the scroll has changed
+        if scroll != self.scroll:
+            self.scroll = scroll
+            self.surface.fill(self.colour)
+            view_width = self.surface.get_width()
+            for image, speed, y in self.layers:
+                # only blit the copies of the layer that are on the screen
+                width = image.get_width()
+                offset = scroll * speed
+                first = max(int(offset // width), 0)
+                last = min(int((offset + view_width) // width), self.repeats - 1)
+                for x in range(first, last + 1):
+                    self.surface.blit(image, ((x * width) - offset, y))
+        surface.blit(self.surface, (0, 0))
@@ -0,0 +1,38 @@
+import pygame
+
+
+# keeps sprites that have left their groups so they can be used again instead of making new ones
+class SpritePool():
+    def __init__(self, sprite_class):
+        self.sprite_class = sprite_class
+        self.free = []
+
+    def get(self, *args):
+        # a free sprite set up again with reset(*args), or a new one when none are free
+        if self.free:
+            sprite = self.free.pop()
+            sprite.reset(*args)
+        else:
+            sprite = self.sprite_class(*args)
+            sprite.pool = self
+        return sprite
+
+
+# a sprite that goes back to its pool when it is killed or removed from its last group
+class PooledSprite(pygame.sprite.Sprite):
+    pool = None
+
+    def kill(self):
+        was_alive = self.alive()
+        pygame.sprite.Sprite.kill(self)
+        if was_alive:
+            self.release()
+
+    def remove_internal(self, group):
+        pygame.sprite.Sprite.remove_internal(self, group)
+        if not self.alive():
+            self.release()
+
+    def release(self):
+        if self.pool is not None:
+            self.pool.free.append(self)
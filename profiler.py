@@ -0,0 +1,85 @@
+import json
+import time
+from collections import deque
+import pygame
+
+
+# records how long each phase of a frame takes, in milliseconds, keeping the last few frames
+class FrameTimer():
+    def __init__(self, enabled=False, history=120):
+        self.enabled = enabled
+        self.history = history
+        self.samples = {}
+        # the frame each sample was taken in, counted from the first frame timed
+        self.frames = {}
+        self.frame = -1
+        self.frame_start = 0
+        self.last = 0
+        self.overlay = None
+        self.overlay_counter = 0
+
+    def set_enabled(self, enabled):
+        # start a fresh history when turned on so the overlay does not mix old and new frames,
+        # a timer keeping every frame for a profile file is never cleared
+        if enabled and not self.enabled:
+            if self.history is not None:
+                self.samples = {}
+                self.frames = {}
+                self.overlay = None
+            self.frame_start = self.last = time.perf_counter()
+        self.enabled = enabled
+
+    def start_frame(self):
+        if self.enabled:
+            self.frame += 1
+            self.frame_start = self.last = time.perf_counter()
+
+    def lap(self, phase):
+        # add the time since the previous lap to this phase
+        if self.enabled:
+            now = time.perf_counter()
+            self.add(phase, now - self.last)
+            self.last = now
+
+    def end_frame(self):
+        if self.enabled:
+            self.add("frame", time.perf_counter() - self.frame_start)
+
+    def add(self, phase, seconds):
+        if phase not in self.samples:
+            self.samples[phase] = deque(maxlen=self.history)
+            self.frames[phase] = deque(maxlen=self.history)
+        self.samples[phase].append(seconds * 1000)
+        self.frames[phase].append(self.frame)
+
+    def averages(self):
+        return {phase: sum(samples) / len(samples) for phase, samples in self.samples.items() if samples}
+
+    def draw(self, surface, font, colour, x, y, refresh=30):
+        # the text is only rendered again every few frames
+        self.overlay_counter -= 1
+        if self.overlay is None or self.overlay_counter <= 0:
+            self.overlay_counter = refresh
+            lines = [f"{phase}: {ms:.2f} ms" for phase, ms in self.averages().items()]
+            if not lines:
+                return None
+            line_height = font.get_linesize()
+            width = max(font.size(line)[0] for line in lines)
+            self.overlay = pygame.Surface((width + 8, len(lines) * line_height + 8), pygame.SRCALPHA)
+            self.overlay.fill((0, 0, 0, 160))
+            for i, line in enumerate(lines):
+                self.overlay.blit(font.render(line, True, colour), (4, 4 + i * line_height))
+        return surface.blit(self.overlay, (x, y))
+
+    def summary(self):
+        # one line per phase with the average and worst time in the history
+        lines = []
+        for phase, samples in self.samples.items():
+            if samples:
+                lines.append(f"{phase:16} avg {sum(samples) / len(samples):8.3f} ms  max {max(samples):8.3f} ms")
+        return "\n".join(lines)
+
+    def save(self, path):
+        with open(path, "w") as timing_file:
+            json.dump({"phases": {phase: list(samples) for phase, samples in self.samples.items()},
+                       "frames": {phase: list(frames) for phase, frames in self.frames.items()}}, timing_file)
@@ -0,0 +1,56 @@
+import pygame
+
+
+# decides what part of the screen is sent to the display each frame,
+# still screens like the menu are drawn once and after that only the parts that change are sent
+class ScreenUpdates():
+    def __init__(self, surface):
+        self.surface = surface
+        self.rects = []
+        self.full = True
+        # the still screen on the display and a copy of it without the overlay
+        self.still = None
+        self.still_copy = None
+        self.overlay_rect = None
+
+    def is_still(self, name):
+        return self.still == name
+
+    def keep_still(self, name):
+        # the screen drawn this frame stays as it is until moving() is called
+        if self.still != name:
+            self.still = name
+            self.still_copy = self.surface.copy()
+            self.full = True
+
+    def moving(self):
+        # every frame is sent in full again
+        self.still = None
+        self.still_copy = None
+        self.full = True
+
+    def exposed(self):
+        # the window was uncovered or restored, the display lost what was sent before
+        self.full = True
+
+    def clear_overlay(self):
+        # put the still screen back under the overlay of the last frame
+        if self.still is not None and self.overlay_rect:
+            self.surface.blit(self.still_copy, self.overlay_rect, self.overlay_rect)
+            self.rects.append(self.overlay_rect)
+        self.overlay_rect = None
+
+    def add_overlay(self, rect):
+        if rect:
+            self.overlay_rect = rect
+            if rect not in self.rects:
+                self.rects.append(rect)
+
+    def present(self):
+        # nothing is sent when a still screen has not changed
+        if self.full:
+            pygame.display.update()
+        elif self.rects:
+            pygame.display.update(self.rects)
+        self.full = self.still is None
+        self.rects = []
@@ -0,0 +1,24 @@
+import pygame
+
+# number of tile columns baked into each chunk surface
+CHUNK_COLS = 16
+
+
+def bake_chunk(data, first_col, img_list, tile_size, tile_filter=None):
+    # draw a range of columns onto one surface so it can be blitted at once
+    cols = min(CHUNK_COLS, len(data[0]) - first_col)
+    surface = pygame.Surface((cols * tile_size, len(data) * tile_size), pygame.SRCALPHA).convert_alpha()
+    for y, row in enumerate(data):
+        for x in range(first_col, first_col + cols):
+            tile = row[x]
+            if tile >= 0 and (tile_filter is None or tile_filter(tile)):
+                surface.blit(img_list[tile], ((x - first_col) * tile_size, y * tile_size))
+    return surface
+
+
+def visible_chunks(scroll, view_width, chunk_count, tile_size):
+    # return the range of chunk indexes that overlap the view
+    chunk_width = CHUNK_COLS * tile_size
+    first = max(int(scroll // chunk_width), 0)
+    last = min(int((scroll + view_width - 1) // chunk_width), chunk_count - 1)
+    return range(first, last + 1)